@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of record field selection in tap-bronto.
+
+Times building a selector for a catalog entry and running it over one
+record, for FieldSelector and for the per-record selection it replaced
+(a metadata lookup per field and funcy `project` on every record). The
+record carries a value of the declared type for every schema field, with
+datetimes in the string fields as zeep returns them, plus unselected keys.
+
+    python benchmarks/field_selector.py
+    python benchmarks/field_selector.py --stream inbound_activity --unselected 5
+
+The run fails if the two selectors return different records.
+"""
+
+import argparse
+import copy
+import os
+import sys
+import timeit
+
+from datetime import datetime, timezone
+
+from funcy import project
+from singer import metadata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tap_bronto.schemas import (  # noqa: E402
+    STREAMS, FieldSelector, catalog_entry, is_selected)
+
+VALUES = {
+    'string': datetime(2026, 10, 1, 12, 30, 15, 250000, tzinfo=timezone.utc),
+    'number': 12.5,
+    'integer': 7,
+    'boolean': True,
+    'array': ['a', 'b'],
+}
+
+
+def naive_selector(catalog, schema):
+    # get_field_selector as it was before FieldSelector.
+    selections = [field for field in schema.get('properties')
+                  if is_selected(catalog, field)]
+
+    def select(data):
+        to_return = {}
+
+        for k, v in project(data, selections).items():
+            if isinstance(v, datetime):
+                to_return[k] = v.replace(microsecond=0).isoformat()
+
+            else:
+                to_return[k] = v
+
+        return to_return
+
+    return select
+
+
+def select_all(entry):
+    mdata = metadata.to_map(copy.deepcopy(entry['metadata']))
+
+    for breadcrumb in mdata:
+        mdata = metadata.write(mdata, breadcrumb, 'selected', True)
+
+    return dict(entry, metadata=metadata.to_list(mdata))
+
+
+def make_record(schema, unselected):
+    record = {}
+
+    for field, field_schema in schema['properties'].items():
+        types = field_schema['type']
+        if isinstance(types, str):
+            types = [types]
+
+        record[field] = VALUES[[t for t in types if t != 'null'][0]]
+
+    for number in range(unselected):
+        record['unselected{}'.format(number)] = 'value'
+
+    return record
+
+
+def time_us(function, number):
+    # Best of five, in microseconds per call.
+    return min(timeit.repeat(function, number=number, repeat=5)) \
+        / number * 10 ** 6
+
+
+def benchmark(stream, unselected, number):
+    catalog = select_all(catalog_entry(stream))
+    schema = catalog['schema']
+    record = make_record(schema, unselected)
+    selectors = {'naive': naive_selector, 'compiled': FieldSelector}
+    results = {}
+
+    for name, build in selectors.items():
+        select = build(catalog, schema)
+        results[name] = {
+            'build_us': time_us(lambda: build(catalog, schema),
+                                max(number // 100, 1)),
+            'record_us': time_us(lambda: select(record), number),
+            'output': select(record),
+        }
+
+    return len(schema['properties']), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--stream', default='contact',
+                        choices=[table for table, _, _, _ in STREAMS])
+    parser.add_argument('--unselected', type=int, default=10,
+                        help='Keys in the record that are not in the '
+                             'schema. Defaults to 10.')
+    parser.add_argument('--number', type=int, default=20000,
+                        help='Records selected per timing. Defaults to '
+                             '20000.')
+    args = parser.parse_args()
+
+    fields, results = benchmark(args.stream, args.unselected, args.number)
+
+    print('{}: {} fields selected, {} unselected keys per record'
+          .format(args.stream, fields, args.unselected))
+    for name, result in results.items():
+        print('{:<9} build {:8.1f} us   per record {:6.2f} us'
+              .format(name, result['build_us'], result['record_us']))
+
+    if results['naive']['output'] != results['compiled']['output']:
+        print('The selectors returned different records.', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
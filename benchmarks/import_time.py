@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Startup benchmark for tap-bronto.
+
+Runs `--discover` in fresh child processes with `python -X importtime` and
+reports the median import time of tap_bronto itself (on top of
+singer-python, which every tap pays for), the median wall time of the
+whole discovery, and any heavy modules discovery pulled in.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 20 --budget-ms 40
+
+The run fails if tap_bronto's own import time is over --budget-ms, or if
+discovery imported any of the sync-only modules (zeep, lxml, aiohttp).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# singer is imported first, so tap_bronto's line only counts its own cost.
+TAP = 'import singer; import tap_bronto; tap_bronto.main()'
+SYNC_ONLY_MODULES = ['zeep', 'lxml', 'aiohttp', 'voluptuous']
+
+
+def parse_importtime(stderr):
+    # {module: cumulative microseconds} from -X importtime output.
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+def discover(config_path):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', TAP,
+         '-c', config_path, '--discover'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=ROOT,
+        check=True, universal_newlines=True)
+    elapsed = time.perf_counter() - started
+
+    json.loads(result.stdout)
+
+    return elapsed, parse_importtime(result.stderr)
+
+
+def benchmark(runs):
+    with tempfile.TemporaryDirectory() as directory:
+        config_path = os.path.join(directory, 'config.json')
+        with open(config_path, 'w') as handle:
+            json.dump({'token': 'benchmark',
+                       'start_date': '2017-01-01T00:00:00Z'}, handle)
+
+        import_ms = []
+        discover_ms = []
+        imported = set()
+
+        for _ in range(runs):
+            elapsed, times = discover(config_path)
+            import_ms.append(times['tap_bronto'] / 1000)
+            discover_ms.append(elapsed * 1000)
+            imported |= {name.split('.')[0] for name in times}
+
+    return {
+        'import_ms': statistics.median(import_ms),
+        'discover_ms': statistics.median(discover_ms),
+        'sync_only_modules': sorted(set(SYNC_ONLY_MODULES) & imported),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=50.0,
+                        help='Allowed median import time of tap_bronto, '
+                             'excluding singer. Defaults to 50.')
+    args = parser.parse_args()
+
+    result = benchmark(args.runs)
+
+    print('import tap_bronto: {:.1f} ms (median of {}, budget {:.0f} ms)'
+          .format(result['import_ms'], args.runs, args.budget_ms))
+    print('--discover:        {:.1f} ms wall time'
+          .format(result['discover_ms']))
+
+    failed = False
+    if result['import_ms'] > args.budget_ms:
+        print('Import time is over budget.', file=sys.stderr)
+        failed = True
+
+    if result['sync_only_modules']:
+        print('Discovery imported {}.'.format(
+            ', '.join(result['sync_only_modules'])), file=sys.stderr)
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
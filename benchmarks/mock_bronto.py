@@ -0,0 +1,596 @@
+#!/usr/bin/env python
+"""
+A local stand-in for the Bronto v4 SOAP API.
+
+Serves a copy of the WSDL and implements the read operations the tap uses
+against a synthetic, deterministic account. Volume, page sizes, latency
+and injected faults are all configurable, so the tap can be exercised and
+benchmarked without a live Bronto account.
+
+    python benchmarks/mock_bronto.py --port 8765 --contacts 20000
+"""
+
+import argparse
+import gzip
+import hashlib
+import os
+import random
+import socket
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+NS = 'http://api.bronto.com/v4'
+SOAP_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+WSDL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'fixtures', 'bronto_v4.wsdl')
+WSDL_ADDRESS = 'http://127.0.0.1:8765/v4'
+# How long a call injected with --timeout-every hangs. The tap's
+# http_read_timeout has to be shorter for it to see a read timeout.
+DEFAULT_STALL_SECONDS = 5.0
+
+ACTIVITY_TYPES = ['open', 'click', 'conversion', 'bounce', 'send',
+                  'unsubscribe', 'view']
+UNSUBSCRIBE_METHODS = ['subscriber', 'admin', 'bulk', 'listcleaning',
+                       'fbl', 'complaint', 'account', 'api']
+FIELD_TYPES = ['text', 'textarea', 'checkbox', 'integer', 'currency',
+               'float', 'date', 'select']
+
+
+class Fault(Exception):
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _fmt(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _parse(value):
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _spread(count, start, end, seed):
+    # Deterministic, sorted timestamps spread across [start, end).
+    rng = random.Random(seed)
+    span = (end - start).total_seconds()
+    return sorted(start + timedelta(seconds=rng.random() * span)
+                  for _ in range(count))
+
+
+class Account:
+
+    def __init__(self, contacts=1000, lists=25, unsubscribes=200,
+                 inbound=5000, outbound=5000, fields=5, days=365,
+                 list_memberships=3, seed=1, now=None):
+        self.now = now or datetime.now(timezone.utc).replace(microsecond=0)
+        self.seed = seed
+        self.days = days
+        self.list_memberships = list_memberships
+
+        history_start = self.now - timedelta(days=days)
+        activity_start = self.now - timedelta(days=30)
+
+        self.contact_times = _spread(contacts, history_start, self.now,
+                                     seed)
+        self.unsubscribe_times = _spread(unsubscribes, history_start,
+                                         self.now, seed + 1)
+        self.inbound_times = _spread(inbound, activity_start, self.now,
+                                     seed + 2)
+        self.outbound_times = _spread(outbound, activity_start, self.now,
+                                      seed + 3)
+        self.list_count = lists
+        self.field_count = fields
+
+    def _id(self, kind, index):
+        return hashlib.md5('{}-{}-{}'.format(self.seed, kind, index)
+                           .encode('utf-8')).hexdigest()[:16]
+
+    def contact(self, index, options):
+        modified = self.contact_times[index]
+        rng = random.Random(self.seed * 1000003 + index)
+        parts = [
+            ('id', self._id('contact', index)),
+            ('email', 'contact{}@example.com'.format(index)),
+            ('mobileNumber', '1555{:07d}'.format(index)),
+            ('status', rng.choice(['active', 'onboarding', 'unsub'])),
+            ('msgPref', rng.choice(['html', 'text'])),
+            ('source', rng.choice(['api', 'import', 'webform'])),
+            ('customSource', None),
+            ('created', _fmt(modified - timedelta(days=rng.randint(0, 90)))),
+            ('modified', _fmt(modified)),
+            ('deleted', 'false'),
+        ]
+
+        if options.get('includeLists'):
+            for offset in range(self.list_memberships):
+                parts.append(('listIds', self._id(
+                    'list', (index + offset) % max(self.list_count, 1))))
+
+        for field_id in options.get('fields', []):
+            parts.append(('fields', [
+                ('fieldId', field_id),
+                ('content', 'value-{}-{}'.format(field_id, index)),
+            ]))
+
+        if options.get('includeSMSKeywords'):
+            parts.append(('SMSKeywordIDs', self._id('keyword', index % 7)))
+
+        parts += [
+            ('numSends', str(rng.randint(0, 500))),
+            ('numBounces', str(rng.randint(0, 5))),
+            ('numOpens', str(rng.randint(0, 200))),
+            ('numClicks', str(rng.randint(0, 50))),
+            ('numConversions', str(rng.randint(0, 10))),
+            ('conversionAmount', '{:.2f}'.format(rng.random() * 1000)),
+        ]
+
+        read_only = []
+        if options.get('includeGeoIPData'):
+            read_only += [
+                ('geoIPCity', 'Atlanta'),
+                ('geoIPStateRegion', 'GA'),
+                ('geoIPZip', '30303'),
+                ('geoIPCountry', 'United States'),
+                ('geoIPCountryCode', 'US'),
+            ]
+        if options.get('includeTechnologyData'):
+            read_only += [
+                ('primaryBrowser', 'Chrome'),
+                ('mobileBrowser', 'Safari mobile'),
+                ('primaryEmailClient', 'Gmail'),
+                ('mobileEmailClient', 'Apple Mail'),
+                ('operatingSystem', 'MacOSX'),
+            ]
+        if options.get('includeRFMData'):
+            read_only += [
+                ('firstOrderDate', _fmt(modified - timedelta(days=60))),
+                ('lastOrderDate', _fmt(modified - timedelta(days=1))),
+                ('lastOrderTotal', '{:.2f}'.format(rng.random() * 200)),
+                ('totalOrders', str(rng.randint(0, 40))),
+                ('totalRevenue', '{:.2f}'.format(rng.random() * 5000)),
+                ('averageOrderValue', '{:.2f}'.format(rng.random() * 100)),
+            ]
+        if options.get('includeEngagementData'):
+            read_only += [
+                ('lastDeliveryDate', _fmt(modified - timedelta(hours=5))),
+                ('lastOpenDate', _fmt(modified - timedelta(hours=3))),
+                ('lastClickDate', _fmt(modified - timedelta(hours=1))),
+            ]
+        if read_only:
+            parts.append(('readOnlyContactData', read_only))
+
+        return parts
+
+    def mail_list(self, index):
+        return [
+            ('id', self._id('list', index)),
+            ('name', 'list_{}'.format(index)),
+            ('label', 'List {}'.format(index)),
+            ('activeCount', str(index * 37)),
+            ('status', 'active'),
+            ('visibility', 'private'),
+        ]
+
+    def unsubscribe(self, index):
+        rng = random.Random(self.seed * 7 + index)
+        return [
+            ('contactId', self._id('contact', rng.randrange(
+                max(len(self.contact_times), 1)))),
+            ('deliveryId', self._id('delivery', index % 97)),
+            ('method', rng.choice(UNSUBSCRIBE_METHODS)),
+            ('complaint', None),
+            ('created', _fmt(self.unsubscribe_times[index])),
+        ]
+
+    def activity(self, kind, index, created):
+        rng = random.Random(self.seed * 31 + index + len(kind))
+        activity_type = rng.choice(ACTIVITY_TYPES)
+        parts = [
+            ('createdDate', _fmt(created)),
+            ('contactId', self._id('contact', rng.randrange(
+                max(len(self.contact_times), 1)))),
+            ('listId', self._id('list', index % max(self.list_count, 1))),
+            ('messageId', self._id('message', index % 13)),
+            ('deliveryId', self._id('delivery', index % 97)),
+            ('activityType', activity_type),
+            ('emailAddress', 'contact{}@example.com'.format(index)),
+            ('contactStatus', 'active'),
+            ('messageName', 'Message {}'.format(index % 13)),
+            ('deliveryType', 'bulk'),
+            ('deliveryStart', _fmt(created - timedelta(hours=2))),
+            ('listName', 'list_{}'.format(index % max(self.list_count, 1))),
+        ]
+        if activity_type == 'click':
+            parts += [('linkName', 'Shop now'),
+                      ('linkUrl', 'https://example.com/{}'.format(index))]
+        if activity_type == 'bounce':
+            parts += [('bounceType', 'bad_email'),
+                      ('bounceReason', 'mailbox does not exist')]
+        return parts
+
+    def field(self, index):
+        return [
+            ('id', self._id('field', index)),
+            ('name', 'custom_field_{}'.format(index)),
+            ('label', 'Custom Field {}'.format(index)),
+            ('type', FIELD_TYPES[index % len(FIELD_TYPES)]),
+            ('visibility', 'private'),
+        ]
+
+
+def _render(parts, out):
+    for name, value in parts:
+        if value is None:
+            continue
+        if isinstance(value, list):
+            out.append('<{}>'.format(name))
+            _render(value, out)
+            out.append('</{}>'.format(name))
+        else:
+            out.append('<{0}>{1}</{0}>'.format(name, escape(value)))
+
+
+def _envelope(operation, rows):
+    out = ['<?xml version="1.0" encoding="UTF-8"?>',
+           '<soap:Envelope xmlns:soap="{}"><soap:Body>'.format(SOAP_NS),
+           '<ns2:{}Response xmlns:ns2="{}">'.format(operation, NS)]
+    for row in rows:
+        if isinstance(row, str):
+            out.append('<return>{}</return>'.format(escape(row)))
+        else:
+            out.append('<return>')
+            _render(row, out)
+            out.append('</return>')
+    out.append('</ns2:{}Response></soap:Body></soap:Envelope>'
+               .format(operation))
+    return ''.join(out).encode('utf-8')
+
+
+def _fault_envelope(fault):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<soap:Envelope xmlns:soap="{soap}"><soap:Body><soap:Fault>'
+        '<faultcode>soap:Server</faultcode>'
+        '<faultstring>{code}: {message}</faultstring>'
+        '<detail><ns2:ApiException xmlns:ns2="{ns}">'
+        '<errorCode>{code}</errorCode><message>{message}</message>'
+        '</ns2:ApiException></detail>'
+        '</soap:Fault></soap:Body></soap:Envelope>'
+    ).format(soap=SOAP_NS, ns=NS, code=fault.code,
+             message=escape(fault.message)).encode('utf-8')
+
+
+def _children(element):
+    return {etree.QName(child).localname: child for child in element}
+
+
+def _text(element, name, default=None):
+    for child in element:
+        if etree.QName(child).localname == name:
+            return child.text
+    return default
+
+
+def _window(times, start, end):
+    # Indices of timestamps in [start, end).
+    from bisect import bisect_left
+    return bisect_left(times, start), bisect_left(times, end)
+
+
+class MockBronto:
+
+    def __init__(self, account, page_size=5000, latency=0.0,
+                 expire_every=0, timeout_every=0, throttle_every=0,
+                 session_ttl=0, compress=False,
+                 stall_seconds=DEFAULT_STALL_SECONDS):
+        self.account = account
+        self.page_size = page_size
+        self.latency = latency
+        self.expire_every = expire_every
+        self.timeout_every = timeout_every
+        self.stall_seconds = stall_seconds
+        self.throttle_every = throttle_every
+        self.session_ttl = session_ttl
+        self.compress = compress
+
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.cursors = {}
+        self.calls = 0
+        self.counts = {}
+
+    def _count(self, operation):
+        with self.lock:
+            self.calls += 1
+            self.counts[operation] = self.counts.get(operation, 0) + 1
+            return self.calls
+
+    def _check_session(self, header, call_number):
+        session_id = None
+        if header is not None:
+            for element in header.iter():
+                if etree.QName(element).localname == 'sessionId':
+                    session_id = element.text
+
+        with self.lock:
+            created = self.sessions.get(session_id)
+
+        if created is None:
+            raise Fault(103, 'Authentication failed for session.')
+        if self.session_ttl and time.time() - created > self.session_ttl:
+            raise Fault(103, 'Authentication failed for session.')
+        if self.expire_every and call_number % self.expire_every == 0:
+            with self.lock:
+                self.sessions.pop(session_id, None)
+            raise Fault(103, 'Authentication failed for session.')
+        if self.throttle_every and call_number % self.throttle_every == 0:
+            raise Fault(109, 'Too many concurrent requests. Please retry.')
+
+        return session_id
+
+    def handle(self, body):
+        envelope = etree.fromstring(body)
+        parts = _children(envelope)
+        header = parts.get('Header')
+        request = parts['Body'][0]
+        operation = etree.QName(request).localname
+        call_number = self._count(operation)
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.timeout_every and call_number % self.timeout_every == 0:
+            # Hang past the client's read timeout, so it gives up waiting,
+            # then drop the call unanswered.
+            time.sleep(self.stall_seconds)
+            raise socket.timeout()
+
+        if operation == 'login':
+            session_id = hashlib.md5(
+                '{}-{}'.format(time.time(), call_number).encode('utf-8')
+            ).hexdigest()
+            with self.lock:
+                self.sessions[session_id] = time.time()
+            return _envelope(operation, [session_id])
+
+        session_id = self._check_session(header, call_number)
+        handler = getattr(self, 'op_' + operation, None)
+        if handler is None:
+            raise Fault(101, 'Unknown operation {}'.format(operation))
+
+        return _envelope(operation, handler(request, session_id))
+
+    def _page(self, request):
+        page_number = int(_text(request, 'pageNumber', '1'))
+        page_size = int(_text(request, 'pageSize', '0') or 0) \
+            or self.page_size
+        page_size = min(page_size, self.page_size)
+        return (page_number - 1) * page_size, page_size
+
+    def op_readContacts(self, request, session_id):
+        filters = _children(request).get('filter')
+        start, end = self.account.now - timedelta(days=100000), \
+            self.account.now + timedelta(days=1)
+        if filters is not None:
+            for modified in filters:
+                if etree.QName(modified).localname != 'modified':
+                    continue
+                operator = _text(modified, 'operator')
+                value = _parse(_text(modified, 'value'))
+                if operator in ('After', 'AfterOrSameDay', 'SameDay'):
+                    if operator == 'AfterOrSameDay':
+                        value = value.replace(hour=0, minute=0, second=0)
+                    start = value
+                elif operator in ('Before', 'BeforeOrSameDay'):
+                    end = value
+
+        options = {}
+        for flag in ['includeLists', 'includeSMSKeywords',
+                     'includeGeoIPData', 'includeTechnologyData',
+                     'includeRFMData', 'includeEngagementData']:
+            options[flag] = _text(request, flag) == 'true'
+        options['fields'] = [child.text for child in request
+                             if etree.QName(child).localname == 'fields'
+                             and child.text]
+
+        low, high = _window(self.account.contact_times, start, end)
+        offset, size = self._page(request)
+        first = low + offset
+        return [self.account.contact(index, options)
+                for index in range(first, min(first + size, high))]
+
+    def op_readLists(self, request, session_id):
+        offset, size = self._page(request)
+        return [self.account.mail_list(index) for index in
+                range(offset, min(offset + size, self.account.list_count))]
+
+    def op_readFields(self, request, session_id):
+        offset, size = self._page(request)
+        return [self.account.field(index) for index in
+                range(offset, min(offset + size, self.account.field_count))]
+
+    def op_readUnsubscribes(self, request, session_id):
+        filters = _children(request).get('filter')
+        start = _parse(_text(filters, 'start'))
+        end = _parse(_text(filters, 'end'))
+        low, high = _window(self.account.unsubscribe_times, start, end)
+        offset, size = self._page(request)
+        first = low + offset
+        return [self.account.unsubscribe(index)
+                for index in range(first, min(first + size, high))]
+
+    def _activities(self, kind, times, request, session_id):
+        filters = _children(request).get('filter')
+        start = _parse(_text(filters, 'start'))
+        end = _parse(_text(filters, 'end'))
+        size = min(int(_text(filters, 'size', '5000')), self.page_size)
+        direction = _text(filters, 'readDirection', 'FIRST')
+
+        key = (session_id, kind, start, end)
+        with self.lock:
+            if direction == 'FIRST':
+                offset = 0
+            else:
+                offset = self.cursors.get(key, 0)
+            self.cursors[key] = offset + size
+
+        low, high = _window(times, start, end)
+        first = low + offset
+        if first >= high and direction == 'NEXT':
+            raise Fault(116, 'End of result set.')
+        return [self.account.activity(kind, index, times[index])
+                for index in range(first, min(first + size, high))]
+
+    def op_readRecentInboundActivities(self, request, session_id):
+        return self._activities('inbound', self.account.inbound_times,
+                                request, session_id)
+
+    def op_readRecentOutboundActivities(self, request, session_id):
+        return self._activities('outbound', self.account.outbound_times,
+                                request, session_id)
+
+
+def make_handler(mock):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+        wsdl = b''
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body):
+            # Compress replies the way Bronto's front end does, when the
+            # client says it can take gzip.
+            accepts = self.headers.get('Accept-Encoding', '')
+            compress = mock.compress and 'gzip' in accepts
+
+            if compress:
+                body = gzip.compress(body, compresslevel=6)
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/xml; charset=utf-8')
+            if compress:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._send(200, self.wsdl)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length)
+            try:
+                response = mock.handle(body)
+            except socket.timeout:
+                # The client has stopped waiting by now.
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            except Fault as fault:
+                self._send(500, _fault_envelope(fault))
+                return
+            self._send(200, response)
+
+    return Handler
+
+
+def serve(mock, host='127.0.0.1', port=8765):
+    handler = make_handler(mock)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    # Point the WSDL at wherever we actually bound, which matters when
+    # port 0 asks the OS for a free port.
+    address = 'http://{}:{}/v4'.format(*server.server_address)
+    with open(WSDL_PATH, 'rb') as handle:
+        handler.wsdl = handle.read().replace(WSDL_ADDRESS.encode('utf-8'),
+                                             address.encode('utf-8'))
+
+    return server
+
+
+def start_in_thread(mock, host='127.0.0.1', port=0):
+    server = serve(mock, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://{}:{}/v4?wsdl'.format(*server.server_address)
+
+
+def account_args(parser):
+    parser.add_argument('--contacts', type=int, default=1000)
+    parser.add_argument('--lists', type=int, default=25)
+    parser.add_argument('--unsubscribes', type=int, default=200)
+    parser.add_argument('--inbound', type=int, default=5000)
+    parser.add_argument('--outbound', type=int, default=5000)
+    parser.add_argument('--fields', type=int, default=5)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--page-size', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds of latency added to every call.')
+    parser.add_argument('--expire-every', type=int, default=0,
+                        help='Expire the session (fault 103) every N calls.')
+    parser.add_argument('--timeout-every', type=int, default=0,
+                        help='Stall every N calls for --stall-seconds, '
+                             'past the client\'s read timeout.')
+    parser.add_argument('--stall-seconds', type=float,
+                        default=DEFAULT_STALL_SECONDS,
+                        help='How long a call stalls with --timeout-every. '
+                             'Defaults to {:.0f}.'
+                             .format(DEFAULT_STALL_SECONDS))
+    parser.add_argument('--throttle-every', type=int, default=0,
+                        help='Return a throttling fault every N calls.')
+    parser.add_argument('--gzip', action='store_true',
+                        help='Gzip replies to clients that accept it.')
+
+
+def mock_from_args(args):
+    account = Account(contacts=args.contacts, lists=args.lists,
+                      unsubscribes=args.unsubscribes, inbound=args.inbound,
+                      outbound=args.outbound, fields=args.fields,
+                      days=args.days, seed=args.seed)
+    return MockBronto(account, page_size=args.page_size,
+                      latency=args.latency, expire_every=args.expire_every,
+                      timeout_every=args.timeout_every,
+                      stall_seconds=args.stall_seconds,
+                      throttle_every=args.throttle_every,
+                      compress=args.gzip)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    account_args(parser)
+    args = parser.parse_args()
+
+    server = serve(mock_from_args(args), args.host, args.port)
+    print('Serving mock Bronto API at http://{}:{}/v4?wsdl'
+          .format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+End-to-end throughput benchmark for tap-bronto.
+
+Starts the mock Bronto API from mock_bronto.py, then runs `tap_bronto.main`
+once per stream in a child process against a synthetic account. For every
+stream it reports records/sec, requests issued, peak RSS and CPU time.
+
+    python benchmarks/run_benchmarks.py --contacts 20000 --days 90
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json
+
+With --compare, the run fails if any stream got slower than the baseline by
+more than --tolerance.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timedelta, timezone
+
+import mock_bronto
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STREAMS = ['contact', 'list', 'unsubscribe', 'inbound_activity',
+           'outbound_activity']
+TAP = 'import tap_bronto; tap_bronto.main()'
+
+
+def run_tap(args, env, log_path):
+    # Run the tap in a child process, counting records as they stream out
+    # of stdout. wait4 gives the child's own peak RSS and CPU time.
+    with open(log_path, 'wb') as log:
+        process = subprocess.Popen([sys.executable, '-c', TAP] + args,
+                                   stdout=subprocess.PIPE, stderr=log,
+                                   cwd=ROOT, env=env)
+    records = 0
+    for line in process.stdout:
+        if line.startswith(b'{"type": "RECORD"') or \
+           line.startswith(b'{"type":"RECORD"'):
+            records += 1
+
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        with open(log_path) as log:
+            sys.stderr.write(''.join(log.readlines()[-20:]))
+        raise RuntimeError('tap-bronto exited with {}, see {}'
+                           .format(process.returncode, log_path))
+
+    return records, usage
+
+
+def discover(config_path, env):
+    output = subprocess.check_output(
+        [sys.executable, '-c', TAP, '-c', config_path, '--discover'],
+        stderr=subprocess.DEVNULL, cwd=ROOT, env=env)
+    return json.loads(output)
+
+
+def select_only(catalog, stream):
+    streams = []
+    for entry in catalog['streams']:
+        if entry['stream'] != stream:
+            continue
+        for mdata in entry['metadata']:
+            mdata['metadata']['selected'] = True
+        streams.append(entry)
+    return {'streams': streams}
+
+
+def benchmark(args):
+    mock = mock_bronto.mock_from_args(args)
+    server, wsdl = mock_bronto.start_in_thread(mock)
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    workdir = tempfile.mkdtemp(prefix='tap-bronto-bench-')
+    start_date = datetime.now(timezone.utc) - timedelta(days=args.days)
+
+    config = {'token': 'benchmark', 'start_date': start_date.isoformat(),
+              'wsdl': wsdl, 'wsdl_cache': False}
+    if args.timeout_every:
+        # Give up on stalled calls well before the mock answers them.
+        config['http_read_timeout'] = args.stall_seconds / 2
+    config.update(json.loads(args.config))
+    config_path = os.path.join(workdir, 'config.json')
+    with open(config_path, 'w') as handle:
+        json.dump(config, handle)
+
+    catalog = discover(config_path, env)
+
+    results = {}
+    try:
+        for stream in args.streams:
+            catalog_path = os.path.join(workdir, stream + '.json')
+            with open(catalog_path, 'w') as handle:
+                json.dump(select_only(catalog, stream), handle)
+
+            calls_before = mock.calls
+            started = time.time()
+            records, usage = run_tap(
+                ['-c', config_path, '--properties', catalog_path], env,
+                os.path.join(workdir, stream + '.log'))
+            elapsed = time.time() - started
+
+            results[stream] = {
+                'records': records,
+                'seconds': round(elapsed, 3),
+                'records_per_second': round(records / elapsed, 1),
+                'requests': mock.calls - calls_before,
+                'peak_rss_mb': round(usage.ru_maxrss / 1024.0, 1),
+                'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3),
+            }
+    finally:
+        server.shutdown()
+
+    return results
+
+
+def report(results, baseline=None):
+    columns = ['records', 'seconds', 'records_per_second', 'requests',
+               'peak_rss_mb', 'cpu_seconds']
+    header = ['stream'] + columns + (['vs_baseline'] if baseline else [])
+    rows = [header]
+
+    for stream, result in results.items():
+        row = [stream] + [str(result[column]) for column in columns]
+        if baseline:
+            before = baseline.get(stream, {}).get('records_per_second')
+            row.append('{:+.1%}'.format(
+                result['records_per_second'] / before - 1)
+                if before else 'n/a')
+        rows.append(row)
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print('  '.join(cell.rjust(width)
+                        for cell, width in zip(row, widths)))
+
+
+def regressions(results, baseline, tolerance):
+    failed = []
+    for stream, result in results.items():
+        before = baseline.get(stream, {}).get('records_per_second')
+        if before and result['records_per_second'] < \
+           before * (1 - tolerance):
+            failed.append(stream)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    mock_bronto.account_args(parser)
+    parser.add_argument('--streams', nargs='+', default=STREAMS,
+                        choices=STREAMS)
+    parser.add_argument('--config', default='{}',
+                        help='Extra tap config as JSON, e.g. '
+                             '\'{"fast_decode_streams": ["contact"]}\'.')
+    parser.add_argument('--save', help='Write the results to this file.')
+    parser.add_argument('--compare',
+                        help='Compare against results saved with --save.')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed records/sec drop before --compare '
+                             'fails. Defaults to 0.1 (10%%).')
+    args = parser.parse_args()
+
+    results = benchmark(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+
+    report(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+
+    if baseline:
+        failed = regressions(results, baseline, args.tolerance)
+        if failed:
+            print('Slower than baseline: {}'.format(', '.join(failed)),
+                  file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
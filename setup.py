@@ -17,6 +17,12 @@ setup(
         'funcy==1.10',
         'voluptuous==0.10.5',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'orjson': ['orjson'],
+        'ujson': ['ujson'],
+        'xxhash': ['xxhash'],
+    },
     entry_points='''
     [console_scripts]
     tap-bronto=tap_bronto:main
@@ -2,14 +2,8 @@ import argparse
 import json
 import singer
 
-from tap_bronto.endpoints.contact import ContactStream
-from tap_bronto.endpoints.list import ListStream
-from tap_bronto.endpoints.unsubscribe import UnsubscribeStream
-from tap_bronto.endpoints.outbound_activity import OutboundActivityStream
-from tap_bronto.endpoints.inbound_activity import InboundActivityStream
-
-from tap_bronto.schemas import is_selected
-from tap_bronto.state import load_state, save_state
+from tap_bronto import metrics, output, profiling
+from tap_bronto.schemas import generate_catalog, is_selected
 
 LOGGER = singer.get_logger()  # noqa
 
@@ -70,13 +64,24 @@ def load_catalog(filename):
     return catalog
 
 
-AVAILABLE_STREAM_ACCESSORS = [
-    ContactStream,
-    InboundActivityStream,
-    ListStream,
-    OutboundActivityStream,
-    UnsubscribeStream,
-]
+def get_stream_accessors():
+    # The endpoints pull in zeep, requests and the rest of the sync
+    # machinery, so they are only imported once a sync needs them.
+    # pylint: disable=import-outside-toplevel
+    from tap_bronto.endpoints.contact import ContactStream
+    from tap_bronto.endpoints.list import ListStream
+    from tap_bronto.endpoints.unsubscribe import UnsubscribeStream
+    from tap_bronto.endpoints.outbound_activity import \
+        OutboundActivityStream
+    from tap_bronto.endpoints.inbound_activity import InboundActivityStream
+
+    return [
+        ContactStream,
+        InboundActivityStream,
+        ListStream,
+        OutboundActivityStream,
+        UnsubscribeStream,
+    ]
 
 
 def _is_selected(catalog_entry):
@@ -86,13 +91,35 @@ def _is_selected(catalog_entry):
 
 
 def do_sync(args):
+    # Deferred like the endpoints, so discovery doesn't import them.
+    # pylint: disable=import-outside-toplevel
+    from tap_bronto.archive import ResponseArchive
+    from tap_bronto.limiter import RateLimiter
+    from tap_bronto.scheduler import sync_streams
+    from tap_bronto.session import SessionManager
+    from tap_bronto.state import load_state, save_state, SharedState
+    from tap_bronto.stream import RetryPolicy
+
     LOGGER.info("Starting sync.")
 
     config = load_config(args.config)
     state = load_state(args.state)
     catalog = load_catalog(args.properties)
 
+    output.configure(config)
+    metrics.configure(config)
+
     stream_accessors = []
+    shared_state = SharedState(state)
+    retry_policy = RetryPolicy.from_config(config)
+    rate_limiter = RateLimiter.from_config(config)
+    archive = ResponseArchive.from_config(config, replay=args.replay)
+    max_concurrent_streams = int(config.get('max_concurrent_streams', 1))
+
+    # Streams running side by side each get their own Bronto session.
+    session = None
+    if max_concurrent_streams <= 1:
+        session = SessionManager(config, rate_limiter)
 
     for stream_catalog in catalog.get('streams'):
         stream_accessor = None
@@ -102,39 +129,50 @@ def do_sync(args):
                         .format(stream_catalog.get('stream')))
             continue
 
-        for available_stream_accessor in AVAILABLE_STREAM_ACCESSORS:
+        for available_stream_accessor in get_stream_accessors():
             if available_stream_accessor.matches_catalog(stream_catalog):
                 stream_accessors.append(available_stream_accessor(
-                    config, state, stream_catalog))
+                    config, state, stream_catalog, session=session,
+                    shared_state=shared_state, retry_policy=retry_policy,
+                    rate_limiter=rate_limiter, archive=archive))
 
                 break
 
-    for stream_accessor in stream_accessors:
-        try:
-            stream_accessor.state = state
-            stream_accessor.login()
-            stream_accessor.sync()
-            state = stream_accessor.state
+    try:
+        sync_streams(stream_accessors, max_concurrent_streams)
+    finally:
+        output.flush()
+        metrics.close()
+
+    if session is not None:
+        LOGGER.info("Logged in {} time(s) during sync."
+                    .format(session.login_count))
 
-        except Exception as exception:
-            LOGGER.error(exception)
-            LOGGER.error('Failed to sync endpoint, moving on!')
-            raise exception
+    metrics.report()
+    rate_limiter.report()
 
-    save_state(state)
+    if args.replay:
+        LOGGER.info("Replayed recorded responses, state is unchanged.")
+    else:
+        save_state(shared_state.state)
 
 
 def do_discover(args):
     LOGGER.info("Starting discovery.")
 
-    catalog = []
-
     config = load_config(args.config)
 
-    for available_stream_accessor in AVAILABLE_STREAM_ACCESSORS:
-        stream_accessor = available_stream_accessor(config)
+    # The schemas are static, so discovery needs neither zeep nor the
+    # network, unless custom fields have to be read from the account.
+    catalog = generate_catalog()
 
-        catalog += stream_accessor.generate_catalog()
+    if config.get('custom_fields'):
+        # pylint: disable=import-outside-toplevel
+        from tap_bronto.endpoints.contact import ContactStream
+
+        catalog = [ContactStream(config).generate_catalog()[0]
+                   if entry['stream'] == ContactStream.TABLE else entry
+                   for entry in catalog]
 
     print(json.dumps({'streams': catalog}))
 
@@ -163,9 +201,25 @@ def main():
         help=('When "--discover" is set, this flag selects all '
               'fields for replication in the generated catalog'),
         action='store_true')
+    parser.add_argument(
+        '--replay',
+        help=('Sync from the responses recorded in response_archive_dir '
+              'instead of calling Bronto'),
+        action='store_true')
+    parser.add_argument(
+        '--profile', nargs='?', const=profiling.DEFAULT_PROFILE_PATH,
+        help=('Profile the run and write the stats to this file '
+              '(default: {}). A summary is printed to stderr.'
+              .format(profiling.DEFAULT_PROFILE_PATH)))
+    parser.add_argument(
+        '--profile-top', type=int, default=profiling.DEFAULT_PROFILE_TOP,
+        help='Number of functions to list in the profile summary.')
 
     args = parser.parse_args()
 
+    if args.profile:
+        profiling.start()
+
     try:
         if args.discover:
             do_discover(args)
@@ -176,6 +230,10 @@ def main():
         LOGGER.critical(exception)
         raise exception
 
+    finally:
+        if args.profile:
+            profiling.stop(args.profile, args.profile_top)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,103 @@
+import asyncio
+import importlib
+import importlib.util
+import socket
+import zlib
+
+import requests
+import singer
+
+from requests.structures import CaseInsensitiveDict
+from tap_bronto.decode import build_raw_request, check_raw_response
+from tap_bronto.session import get_accept_encoding, get_http_timeouts, \
+    make_decompressor
+
+LOGGER = singer.get_logger()  # noqa
+
+CHUNK_SIZE = 64 * 1024
+
+
+def is_available():
+    if importlib.util.find_spec('aiohttp') is None:
+        LOGGER.warning('aiohttp is not installed, fetching with threads '
+                       'instead.')
+        return False
+
+    return True
+
+
+class AsyncTransport:
+
+    # Posts SOAP envelopes built by zeep over one aiohttp session, so a
+    # single event loop can keep up to `limit` calls in flight. Replies
+    # are handed back as raw bytes for the fast decoder. Errors surface
+    # as the same Faults and connection errors as the threaded path.
+    # Compressed replies are decompressed here, as the chunks arrive, so
+    # the wire size can be counted alongside the decoded size.
+    def __init__(self, config, limit):
+        self.limit = limit
+        self.accept_encoding = get_accept_encoding(config)
+        self.connect_timeout, self.read_timeout = get_http_timeouts(config)
+        self.aiohttp = importlib.import_module('aiohttp')
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = self.aiohttp.ClientSession(
+            connector=self.aiohttp.TCPConnector(limit=self.limit),
+            timeout=self.aiohttp.ClientTimeout(
+                total=None, sock_connect=self.connect_timeout,
+                sock_read=self.read_timeout),
+            auto_decompress=False)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def read_body(self, reply):
+        # Returns the decoded body and how many bytes it took on the wire.
+        decompressor = make_decompressor(
+            reply.headers.get('Content-Encoding', '').strip().lower())
+        chunks = []
+        wire_bytes = 0
+
+        async for chunk in reply.content.iter_chunked(CHUNK_SIZE):
+            wire_bytes += len(chunk)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            chunks.append(chunk)
+
+        if decompressor is not None:
+            chunks.append(decompressor.flush())
+
+        return b''.join(chunks), wire_bytes
+
+    async def post(self, address, message, headers):
+        headers = dict(headers, **{'Accept-Encoding': self.accept_encoding})
+
+        try:
+            async with self.session.post(address, data=message,
+                                         headers=headers) as reply:
+                response = requests.Response()
+                response.status_code = reply.status
+                response.headers = CaseInsensitiveDict(reply.headers)
+                response._content, wire_bytes = await self.read_body(reply)
+        except asyncio.TimeoutError as e:
+            raise socket.timeout(str(e)) from e
+        except (self.aiohttp.ClientConnectionError,
+                self.aiohttp.ClientPayloadError) as e:
+            raise ConnectionError(str(e)) from e
+        except zlib.error as e:
+            raise ConnectionError('Corrupt compressed response: {}'
+                                  .format(e)) from e
+
+        return response, wire_bytes
+
+    async def send_raw(self, client, operation, kwargs):
+        # Returns the reply body, its size on the wire and its size once
+        # decompressed.
+        address, message, headers = build_raw_request(client, operation,
+                                                      kwargs)
+        response, wire_bytes = await self.post(address, message, headers)
+
+        return (check_raw_response(client, operation, response),
+                wire_bytes, len(response.content))
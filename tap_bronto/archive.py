@@ -0,0 +1,106 @@
+import gzip
+import json
+import os
+
+from datetime import timezone
+
+import singer
+
+from tap_bronto.session import WSDL_NAMESPACE
+from tap_bronto.wsdl_cache import write_atomic
+from zeep.exceptions import Fault
+
+LOGGER = singer.get_logger()  # noqa
+
+
+def empty_response(operation):
+    # What a page that was never recorded replays as: a reply with no
+    # results, which ends the window the same way an empty page does.
+    return ('<soap:Envelope xmlns:soap='
+            '"http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+            '<{0}Response xmlns="{1}"/></soap:Body></soap:Envelope>'
+            .format(operation, WSDL_NAMESPACE)).encode('utf-8')
+
+
+def _window_name(window):
+    if window is None or window[0] is None:
+        return 'none'
+
+    return '_'.join(value.astimezone(timezone.utc)
+                    .strftime('%Y%m%dT%H%M%S.%fZ') for value in window)
+
+
+class ResponseArchive:
+
+    # Raw SOAP responses on disk, gzipped, one file per operation, date
+    # window and page:
+    #   <path>/<operation>/<window start>_<window end>/<page>.xml.gz
+    # A page that ended in a fault Bronto won't retry (like the 116 that
+    # ends an activity window) is kept as <page>.fault.json instead.
+    # Recording overwrites what an earlier run stored for the same page.
+    # Replaying serves the stored responses in place of calls to Bronto.
+    def __init__(self, path, replay=False):
+        self.path = path
+        self.replay = replay
+
+    @classmethod
+    def from_config(cls, config, replay=False):
+        path = config.get('response_archive_dir')
+
+        if not path:
+            if replay:
+                raise RuntimeError('Replaying needs a response_archive_dir.')
+            return None
+
+        if replay:
+            LOGGER.info('Replaying responses from {}.'.format(path))
+        else:
+            LOGGER.info('Recording responses to {}.'.format(path))
+
+        return cls(path, replay)
+
+    def _path(self, operation, window, page, suffix):
+        return os.path.join(self.path, operation, _window_name(window),
+                            '{}{}'.format(page or 1, suffix))
+
+    def store(self, operation, window, page, content):
+        write_atomic(self._path(operation, window, page, '.xml.gz'),
+                     gzip.compress(content, compresslevel=6))
+
+        # A fault stored by an earlier run no longer applies.
+        try:
+            os.unlink(self._path(operation, window, page, '.fault.json'))
+        except FileNotFoundError:
+            pass
+
+    def store_fault(self, operation, window, page, fault):
+        write_atomic(self._path(operation, window, page, '.fault.json'),
+                     json.dumps({'message': fault.message,
+                                 'code': fault.code}).encode('utf-8'))
+
+        try:
+            os.unlink(self._path(operation, window, page, '.xml.gz'))
+        except FileNotFoundError:
+            pass
+
+    def load(self, operation, window, page):
+        # Returns the stored response, or raises the stored fault.
+        try:
+            with open(self._path(operation, window, page, '.fault.json'),
+                      'rb') as handle:
+                fault = json.loads(handle.read().decode('utf-8'))
+        except FileNotFoundError:
+            pass
+        else:
+            raise Fault(fault['message'], fault['code'])
+
+        try:
+            with open(self._path(operation, window, page, '.xml.gz'),
+                      'rb') as handle:
+                return gzip.decompress(handle.read())
+        except FileNotFoundError:
+            LOGGER.info('No archived {} response for {} page {}, treating '
+                        'it as empty.'.format(operation,
+                                              _window_name(window),
+                                              page or 1))
+            return empty_response(operation)
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import time
+
+import singer
+
+from singer import metadata
+from tap_bronto.wsdl_cache import cache_path, write_atomic
+
+LOGGER = singer.get_logger()  # noqa
+
+CACHE_VERSION = '1'
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+# Catalog metadata on each custom field property, so a sync can ask for
+# the selected fields by id without reading the definitions again.
+FIELD_ID_METADATA = 'tap-bronto.field-id'
+
+# How Bronto field types map onto JSON schema types; everything else is
+# replicated as a string.
+FIELD_KINDS = {
+    'integer': 'integer',
+    'float': 'number',
+    'currency': 'number',
+}
+
+
+def field_schema(field):
+    kind = FIELD_KINDS.get(field.get('type'), 'string')
+
+    return {
+        'type': ['null', kind],
+        'description': field.get('label') or field.get('name'),
+    }
+
+
+def property_names(fields, reserved):
+    # Custom fields keep their Bronto name, unless it clashes with one of
+    # the standard contact properties.
+    names = {}
+
+    for field in fields:
+        name = field['name']
+        if name in reserved:
+            name = 'custom_' + name
+        names[field['id']] = name
+
+    return names
+
+
+def get_selected_custom_fields(catalog):
+    # {field id: (property, kind)} for every selected custom field.
+    mdata = metadata.to_map(catalog.get('metadata'))
+    properties = catalog.get('schema', {}).get('properties', {})
+    selected = {}
+
+    for breadcrumb, field_metadata in mdata.items():
+        field_id = field_metadata.get(FIELD_ID_METADATA)
+
+        if field_id is None or not field_metadata.get('selected'):
+            continue
+
+        name = breadcrumb[1]
+        kind = [t for t in properties[name]['type'] if t != 'null'][0]
+        selected[field_id] = (name, kind)
+
+    return selected
+
+
+class CustomFieldIndex:
+
+    # The account's custom field definitions (id, name, label, type) as
+    # read through readFields, cached on disk per account. The cache is
+    # read again once it is older than `timeout` seconds.
+    def __init__(self, stream, path=None, timeout=DEFAULT_CACHE_TTL):
+        self.stream = stream
+        self.path = os.path.join(path or cache_path('fields'),
+                                 'v{}'.format(CACHE_VERSION))
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, stream, config):
+        return cls(stream,
+                   timeout=int(config.get('custom_fields_cache_ttl',
+                                          DEFAULT_CACHE_TTL)))
+
+    def _cache_path(self):
+        config = self.stream.config
+        account = '{}|{}'.format(config.get('wsdl') or '',
+                                 config.get('token'))
+
+        return os.path.join(self.path, hashlib.sha256(
+            account.encode('utf-8')).hexdigest() + '.json')
+
+    def _read_cache(self):
+        try:
+            with open(self._cache_path(), 'rb') as handle:
+                entry = json.loads(handle.read().decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+
+        if self.timeout and \
+           time.time() - entry.get('created', 0) > self.timeout:
+            LOGGER.info('Custom field cache expired.')
+            return None
+
+        return entry.get('fields')
+
+    def _read_fields(self):
+        LOGGER.info('Reading custom field definitions.')
+        self.stream.login()
+
+        fields = []
+        pageNumber = 1
+        while True:
+            results = self.stream.call('readFields', page=pageNumber,
+                                       filter={}, pageNumber=pageNumber)
+            if not results:
+                break
+
+            fields += [{
+                'id': result.id,
+                'name': result.name,
+                'label': result.label,
+                'type': result.type,
+            } for result in results]
+            pageNumber += 1
+
+        try:
+            write_atomic(self._cache_path(), json.dumps(
+                {'created': time.time(), 'fields': fields})
+                .encode('utf-8'))
+        except OSError as e:
+            LOGGER.warning('Could not write the custom field cache: {}'
+                           .format(e))
+
+        return fields
+
+    def get_fields(self):
+        fields = self._read_cache()
+
+        if fields is None:
+            fields = self._read_fields()
+
+        return fields
@@ -0,0 +1,278 @@
+from datetime import datetime
+from io import BytesIO
+
+from lxml import etree
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from zeep.helpers import serialize_object
+from zeep.wsdl.utils import etree_to_string
+from zeep.xsd import ComplexType
+from zeep.xsd.types.builtins import default_types
+
+WSDL_NAMESPACE = 'http://api.bronto.com/v4'
+XSI_NIL = '{http://www.w3.org/2001/XMLSchema-instance}nil'
+
+# Field specs are plain tuples so they can be built once from the WSDL and
+# reused, or sent to another process, without holding on to zeep objects:
+#   ('simple', is_list, xsd type qname as text)
+#   ('complex', is_list, {child name: field spec, ...})
+SIMPLE = 'simple'
+COMPLEX = 'complex'
+
+
+def flatten_record(record, flatten=()):
+    for name in flatten:
+        nested = record.pop(name, None) or {}
+        record = dict(record, **nested)
+
+    return record
+
+
+def custom_value(kind, text):
+    if text is None or kind == 'string':
+        return text
+
+    try:
+        return int(text) if kind == 'integer' else float(text)
+    except ValueError:
+        return None
+
+
+def flatten_custom_fields(record, custom_fields):
+    # readContacts returns custom fields as a list of {fieldId, content};
+    # turn each selected one into a property of its own.
+    for field in record.pop('fields', None) or []:
+        spec = custom_fields.get(field.get('fieldId'))
+
+        if spec is not None:
+            name, kind = spec
+            record[name] = custom_value(kind, field.get('content'))
+
+    return record
+
+
+def _builtin_qname(xsd_type):
+    # Restricted simple types (enumerations and the like) are subclasses of
+    # the builtin they restrict, so walk the MRO until we hit a builtin.
+    for cls in type(xsd_type).__mro__:
+        qname = getattr(cls, '_default_qname', None)
+        if qname is not None and qname in default_types:
+            return qname.text
+
+    return None
+
+
+def _field_spec(element):
+    max_occurs = element.max_occurs
+    is_list = max_occurs == 'unbounded' or \
+        (isinstance(max_occurs, int) and max_occurs > 1)
+
+    if isinstance(element.type, ComplexType):
+        return (COMPLEX, is_list, {
+            name: _field_spec(child)
+            for name, child in element.type.elements
+        })
+
+    return (SIMPLE, is_list, _builtin_qname(element.type))
+
+
+def build_return_spec(client, operation):
+    response = client.get_element(
+        '{%s}%sResponse' % (WSDL_NAMESPACE, operation))
+
+    for name, element in response.type.elements:
+        if name == 'return':
+            return _field_spec(element)[2]
+
+    raise ValueError('Operation {} has no return element'.format(operation))
+
+
+def _localname(element):
+    tag = element.tag
+    return tag[tag.index('}') + 1:] if tag[0] == '{' else tag
+
+
+def _simple_value(qname, text):
+    if text is None:
+        return None
+
+    xsd_type = default_types.get(qname)
+    if xsd_type is None:
+        return text
+
+    try:
+        return xsd_type.pythonvalue(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _empty(spec):
+    return [] if spec[1] else None
+
+
+def _decode(element, spec):
+    if spec[0] == SIMPLE:
+        return _simple_value(spec[2], element.text)
+
+    return _decode_complex(element, spec[2])
+
+
+def _decode_complex(element, fields, wanted=None):
+    values = {}
+
+    for child in element:
+        if not isinstance(child.tag, str):
+            continue
+
+        name = _localname(child)
+        spec = fields.get(name)
+
+        if spec is None or (wanted is not None and name not in wanted):
+            continue
+
+        value = _decode(child, spec)
+
+        if spec[1]:
+            values.setdefault(name, []).append(value)
+        else:
+            values[name] = value
+
+    return {name: values.get(name, _empty(spec))
+            for name, spec in fields.items()
+            if wanted is None or name in wanted}
+
+
+# Decodes a raw SOAP response straight into selected, flattened records.
+# Produces exactly what decode_results() does for the same response, but
+# without building zeep objects or touching unselected fields.
+class RecordDecoder:
+
+    def __init__(self, fields, selections, flatten=(), custom_fields=None):
+        self.fields = fields
+        self.selections = list(selections)
+        self.flatten = {name: fields[name][2] for name in flatten}
+        self.custom_fields = custom_fields or {}
+
+        wanted = set(self.selections)
+        self.wanted = {name for name in fields
+                       if name in wanted and name not in self.flatten}
+        self.nested_wanted = {
+            name: {child for child in nested if child in wanted}
+            for name, nested in self.flatten.items()
+        }
+
+    def decode_element(self, element):
+        record = _decode_complex(element, self.fields, self.wanted)
+
+        for child in element:
+            if not isinstance(child.tag, str):
+                continue
+
+            name = _localname(child)
+            if name in self.flatten and child.get(XSI_NIL) != 'true':
+                # Mirrors flatten_record: a nested section that is present
+                # contributes all of its fields, and wins over the parent.
+                record.update(_decode_complex(
+                    child, self.flatten[name], self.nested_wanted[name]))
+            elif name == 'fields' and self.custom_fields:
+                self.decode_custom_field(child, record)
+
+        to_return = {}
+        for key in self.selections:
+            if key in record:
+                value = record[key]
+                if isinstance(value, datetime):
+                    value = value.replace(microsecond=0).isoformat()
+                to_return[key] = value
+
+        return to_return
+
+    def decode_custom_field(self, element, record):
+        values = {_localname(child): child.text for child in element
+                  if isinstance(child.tag, str)}
+        spec = self.custom_fields.get(values.get('fieldId'))
+
+        if spec is not None:
+            name, kind = spec
+            record[name] = custom_value(kind, values.get('content'))
+
+    def decode(self, content):
+        # iterparse lives in the lxml C extension, which pylint can't see.
+        # pylint: disable=c-extension-no-member
+        for _, element in etree.iterparse(BytesIO(content), events=('end',),
+                                          tag=('return', '{*}return')):
+            yield self.decode_element(element)
+
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def build_raw_request(client, operation, kwargs):
+    # zeep has no public API for building an envelope without sending it.
+    # pylint: disable=protected-access
+    service = client.service
+    binding = service._binding
+
+    # zeep only adds the default soap headers (our session) when calling
+    # through the service proxy, so add them here too.
+    if client._default_soapheaders and '_soapheaders' not in kwargs:
+        kwargs = dict(kwargs, _soapheaders=client._default_soapheaders)
+
+    envelope, http_headers = binding._create(
+        operation, (), kwargs, client=client,
+        options=service._binding_options)
+
+    return (service._binding_options['address'], etree_to_string(envelope),
+            http_headers)
+
+
+def check_raw_response(client, operation, response):
+    # pylint: disable=protected-access
+    if response.status_code != 200:
+        # Let zeep turn the error into the same Fault it would normally
+        # raise, so callers handle both paths the same way.
+        binding = client.service._binding
+        binding.process_reply(client, binding.get(operation), response)
+
+    return response.content
+
+
+def send_raw(client, operation, kwargs):
+    address, message, http_headers = build_raw_request(client, operation,
+                                                       kwargs)
+
+    response = client.transport.post(address, message, http_headers)
+
+    return check_raw_response(client, operation, response)
+
+
+def parse_raw_response(client, operation, content):
+    # Parses a raw response with zeep, into what calling the operation
+    # through the service proxy would have returned. zeep only parses
+    # replies from a requests.Response, so build one around the content.
+    # pylint: disable=protected-access
+    response = Response()
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict(
+        {'Content-Type': 'text/xml; charset=utf-8'})
+    response._content = content
+
+    binding = client.service._binding
+    return binding.process_reply(client, binding.get(operation), response)
+
+
+def decode_results(results, field_selector, flatten=(), custom_fields=None):
+    # Pop results off the page as they are decoded, so each zeep object
+    # can be freed as soon as its record has been written.
+    results = list(results or [])
+    results.reverse()
+
+    while results:
+        record = flatten_record(
+            serialize_object(results.pop(), target_cls=dict), flatten)
+
+        if custom_fields:
+            record = flatten_custom_fields(record, custom_fields)
+
+        yield field_selector(record)
@@ -0,0 +1,69 @@
+import asyncio
+import multiprocessing
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import singer
+
+from tap_bronto.output import encode_records, get_encoder
+
+LOGGER = singer.get_logger()  # noqa
+
+_ENCODER = None
+
+
+def _start_worker(encoder_name):
+    # Runs once in each worker process; the encoder is per process state.
+    global _ENCODER  # pylint: disable=global-statement
+
+    _ENCODER = get_encoder(encoder_name)
+
+
+def _encode_page(decoder, content, stream_name, time_extracted):
+    started = time.perf_counter()
+    lines = encode_records(stream_name, decoder.decode(content),
+                           time_extracted, _ENCODER)
+
+    return lines, time.perf_counter() - started
+
+
+class DecodePool:
+
+    # Decodes raw pages on worker processes, so large pages don't hold
+    # the GIL while other windows are being fetched. Workers get the
+    # response bytes and a RecordDecoder, which is plain data, and send
+    # back RECORD lines encoded the way the main process would have.
+    def __init__(self, processes, encoder_name=None):
+        LOGGER.info('Decoding pages on {} worker processes.'
+                    .format(processes))
+
+        # Spawned rather than forked, since the tap already has threads
+        # (and their locks) running by now.
+        self.executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_start_worker,
+            initargs=(encoder_name,))
+
+    @classmethod
+    def from_config(cls, config):
+        processes = int(config.get('decode_processes') or 0)
+
+        if processes < 1:
+            return None
+
+        return cls(processes, config.get('output_json_encoder'))
+
+    def encode_page(self, decoder, content, stream_name, time_extracted):
+        # Returns the page's lines and how long the worker took.
+        return self.executor.submit(_encode_page, decoder, content,
+                                    stream_name, time_extracted).result()
+
+    async def encode_page_async(self, decoder, content, stream_name,
+                                time_extracted):
+        return await asyncio.wrap_future(self.executor.submit(
+            _encode_page, decoder, content, stream_name, time_extracted))
+
+    def close(self):
+        self.executor.shutdown()
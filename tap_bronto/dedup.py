@@ -0,0 +1,146 @@
+import array
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from datetime import datetime
+
+import pytz
+
+BUCKET_FORMAT = '%Y%m%d%H'
+
+
+def _bucket_name(value):
+    return datetime.fromisoformat(value).astimezone(pytz.utc) \
+                   .strftime(BUCKET_FORMAT)
+
+
+def _digest(record):
+    content = json.dumps(record, sort_keys=True, default=str)
+    return int.from_bytes(hashlib.blake2b(content.encode('utf-8'),
+                                          digest_size=8).digest(), 'little')
+
+
+class DedupIndex:
+
+    # Remembers which records a stream has already emitted, so the
+    # activity streams' three-day rewind only emits what is new or has
+    # changed. Records are keyed by a 64-bit hash of their full content
+    # and grouped into one file per hour of `field`. Each file is a sorted
+    # array of hashes. Without a path the index lets everything through.
+    def __init__(self, path, field):
+        self.path = path
+        self.field = field
+        self.buckets = {}
+        self.dirty = set()
+        self.suppressed = 0
+
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config, table, field):
+        directory = config.get('activity_dedup_dir')
+
+        return cls(os.path.join(directory, table) if directory else None,
+                   field)
+
+    def _filename(self, name):
+        return os.path.join(self.path, name + '.bin')
+
+    def bucket(self, name):
+        if name not in self.buckets:
+            hashes = array.array('Q')
+
+            try:
+                with open(self._filename(name), 'rb') as handle:
+                    hashes.frombytes(handle.read())
+            except FileNotFoundError:
+                pass
+
+            self.buckets[name] = set(hashes)
+
+        return self.buckets[name]
+
+    def filter(self, records):
+        if self.path is None:
+            yield from records
+            return
+
+        for record in records:
+            value = record.get(self.field)
+
+            if value is None:
+                yield record
+                continue
+
+            name = _bucket_name(value)
+            hashes = self.bucket(name)
+            digest = _digest(record)
+
+            if digest in hashes:
+                self.suppressed += 1
+                continue
+
+            hashes.add(digest)
+            self.dirty.add(name)
+            yield record
+
+    def prune(self, start):
+        # Later runs never rewind past this run's start, so older hours
+        # can't come up again.
+        if self.path is None:
+            return
+
+        oldest = start.astimezone(pytz.utc).strftime(BUCKET_FORMAT)
+
+        for filename in os.listdir(self.path):
+            name, extension = os.path.splitext(filename)
+
+            if extension == '.bin' and name < oldest:
+                os.remove(os.path.join(self.path, filename))
+                self.buckets.pop(name, None)
+
+    def rewind(self, bookmark):
+        # The index is saved once a STATE message is written, not once the
+        # target has committed it, so it may hold records from past the
+        # state this run resumes from. Drop every hour from the bookmark's
+        # on, so those records are emitted again rather than skipped.
+        if self.path is None:
+            return
+
+        newest = bookmark.astimezone(pytz.utc).strftime(BUCKET_FORMAT)
+
+        for filename in os.listdir(self.path):
+            name, extension = os.path.splitext(filename)
+
+            if extension == '.bin' and name >= newest:
+                os.remove(os.path.join(self.path, filename))
+                self.buckets.pop(name, None)
+                self.dirty.discard(name)
+
+    def clear(self):
+        if self.path is None:
+            return
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+
+        self.buckets = {}
+        self.dirty = set()
+
+    def save(self):
+        # Called right after a STATE message has gone out, so the index
+        # never claims records the target hasn't been sent. The target may
+        # still not have committed them; see rewind.
+        for name in sorted(self.dirty):
+            hashes = array.array('Q', sorted(self.buckets[name]))
+
+            handle, temp_path = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(handle, 'wb') as temp:
+                temp.write(hashes.tobytes())
+            os.replace(temp_path, self._filename(name))
+
+        self.dirty = set()
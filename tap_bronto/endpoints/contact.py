@@ -1,25 +1,86 @@
-from tap_bronto.schemas import get_field_selector, is_selected, \
-    with_properties, CONTACT_SCHEMA
-from tap_bronto.state import incorporate, save_state
-from tap_bronto.stream import Stream
-from funcy import project
+from tap_bronto import aio, profiling
+from tap_bronto.custom_fields import CustomFieldIndex, FIELD_ID_METADATA, \
+    field_schema, get_selected_custom_fields, property_names
+from tap_bronto.schemas import get_field_selector, get_stream_definition
+from tap_bronto.state import incorporate, incorporate_checkpoint, \
+    get_checkpoint, get_last_record_value_for_table
+from tap_bronto.decode_pool import DecodePool
+from tap_bronto.output import write_schema
+from tap_bronto.stream import Stream, non_empty
+from collections import deque
+from singer import metadata
+from concurrent.futures import ThreadPoolExecutor
 
 from datetime import datetime, timedelta
 
+import asyncio
+import copy
+import itertools
 import pytz
 import singer
-import socket
-import zeep
-from zeep.exceptions import Fault
+import time
 
 LOGGER = singer.get_logger()  # noqa
 
 
+# readContacts leaves these fields out of each contact unless the request
+# sets the matching flag.
+CONTACT_INCLUDE_FLAGS = [
+    ('includeLists', ['listIds']),
+    ('includeSMSKeywords', ['SMSKeywordIDs']),
+    ('includeGeoIPData', ['geoIPCity', 'geoIPStateRegion', 'geoIPZip',
+                          'geoIPCountry', 'geoIPCountryCode']),
+    ('includeTechnologyData', ['primaryBrowser', 'mobileBrowser',
+                               'primaryEmailClient', 'mobileEmailClient',
+                               'operatingSystem']),
+    ('includeRFMData', ['firstOrderDate', 'lastOrderDate', 'lastOrderTotal',
+                        'totalOrders', 'totalRevenue', 'averageOrderValue']),
+    ('includeEngagementData', ['lastDeliveryDate', 'lastOpenDate',
+                               'lastClickDate']),
+]
+
+
+class ContactRequestPlan:  # pylint: disable=too-few-public-methods
+
+    # Turns on only the include flags some selected field needs, so
+    # unselected sections (list memberships above all) never go over the
+    # wire. Remembers which fields asked for each flag, to explain itself.
+    # Custom fields are only returned when asked for by id.
+    def __init__(self, selected_fields, custom_fields={}):
+        selected = set(selected_fields)
+
+        self.options = {}
+        self.reasons = {}
+
+        for flag, fields in CONTACT_INCLUDE_FLAGS:
+            needed = [field for field in fields if field in selected]
+
+            self.options[flag] = bool(needed)
+            self.reasons[flag] = needed
+
+        self.options['fields'] = list(custom_fields)
+        self.reasons['fields'] = [name for name, _ in custom_fields.values()]
+
+    def explain(self):
+        for flag, _ in CONTACT_INCLUDE_FLAGS:
+            if self.options[flag]:
+                yield 'readContacts {}: on, for {}.'.format(
+                    flag, ', '.join(self.reasons[flag]))
+            else:
+                yield 'readContacts {}: off, no field that needs it is ' \
+                      'selected.'.format(flag)
+
+        if self.options['fields']:
+            yield 'readContacts fields: {} custom field(s), for {}.'.format(
+                len(self.options['fields']), ', '.join(self.reasons['fields']))
+        else:
+            yield 'readContacts fields: none, no custom field is selected.'
+
+
 class ContactStream(Stream):
     TABLE = 'contact'
-    REPLICATION_KEY = 'modified'
-    KEY_PROPERTIES = ['id']
-    SCHEMA, METADATA = with_properties(CONTACT_SCHEMA, KEY_PROPERTIES, [REPLICATION_KEY])
+    KEY_PROPERTIES, REPLICATION_KEY, SCHEMA, METADATA = \
+        get_stream_definition(TABLE)
 
     def make_filter(self, start, end):
         start_filter = self.factory['dateValue']
@@ -30,120 +91,316 @@ class ContactStream(Stream):
         ef = end_filter(value=end, operator='Before')
         return _filter(type = 'AND', modified=[sf, ef])
 
-    def any_selected(self, field_names):
-        sub_catalog = project(field_names, self.catalog.get('schema'))
-        return any([is_selected(field_catalog)
-                    for field_catalog in sub_catalog])
+    def generate_catalog(self):
+        catalog = super().generate_catalog()
+
+        if not self.config.get('custom_fields'):
+            return catalog
+
+        fields = CustomFieldIndex.from_config(self, self.config).get_fields()
+        names = property_names(fields, self.SCHEMA['properties'])
+
+        properties = dict(self.SCHEMA['properties'])
+        mdata = metadata.to_map(copy.deepcopy(self.METADATA))
+
+        for field in fields:
+            name = names[field['id']]
+            properties[name] = field_schema(field)
+            mdata = metadata.write(mdata, ('properties', name),
+                                   'inclusion', 'available')
+            mdata = metadata.write(mdata, ('properties', name),
+                                   FIELD_ID_METADATA, field['id'])
+
+        return [dict(catalog[0],
+                     schema=dict(self.SCHEMA, properties=properties),
+                     metadata=metadata.to_list(mdata))]
+
     def sync(self):
         key_properties = self.catalog.get('key_properties')
         table = self.TABLE
 
-        singer.write_schema(
+        write_schema(
             self.catalog.get('stream'),
             self.catalog.get('schema'),
             key_properties=key_properties)
 
-        field_selector = get_field_selector(self.catalog,
+        self.field_selector = get_field_selector(self.catalog,
             self.catalog.get('schema'))
 
-        includeGeoIpData = self.any_selected([
-            'geoIPCity', 'geoIPStateRegion', 'geoIPZip',
-            'geoIPCountry', 'geoIPCountryCode'
-        ])
+        self.custom_fields = get_selected_custom_fields(self.catalog)
+        plan = ContactRequestPlan(self.field_selector.fields,
+                                  self.custom_fields)
 
-        includeTechnologyData = self.any_selected([
-            'primaryBrowser', 'mobileBrowser', 'primaryEmailClient'
-            'mobileEmailClient', 'operatingSystem'
-        ])
-
-        includeRFMData = self.any_selected([
-            'firstOrderDate', 'lastOrderDate', 'lastOrderTotal'
-            'totalOrders', 'totalRevenue', 'averageOrderValue'
-        ])
-
-        includeEngagementData = self.any_selected([
-            'lastDeliveryDate', 'lastOpenDate', 'lastClickDate'
-        ])
-
-        if includeGeoIpData:
-            LOGGER.info('Including GEOIP data.')
-
-        if includeTechnologyData:
-            LOGGER.info('Including technology data.')
-
-        if includeRFMData:
-            LOGGER.info('Including RFM data.')
-
-        if includeEngagementData:
-            LOGGER.info('Including engagement data.')
+        for line in plan.explain():
+            LOGGER.info(line)
 
         LOGGER.info('Syncing contacts.')
 
+        options = plan.options
+
         start = self.get_start_date(table)
-        end = start
-        interval = timedelta(hours=6)
-
-        def flatten(item):
-            read_only_data = item.get('readOnlyContactData', {}) or {}
-            item.pop('readOnlyContactData', None)
-            return dict(item, **read_only_data)
-
-
-        while end < datetime.now(pytz.utc):
-            start = end
-            end = start + interval
-            LOGGER.info("Fetching contacts modified from {} to {}".format(
-                start, end))
-
-            _filter = self.make_filter(start, end)
-
-            pageNumber = 1
-            hasMore = True
-            while hasMore:
-                retry_count = 0
-                try:
-                    results = self.client.service.readContacts(
-                        filter=_filter,
-                        includeLists=True,
-                        fields=[],
-                        pageNumber=pageNumber,
-                        includeSMSKeywords=True,
-                        includeGeoIPData=includeGeoIpData,
-                        includeTechnologyData=includeTechnologyData,
-                        includeRFMData=includeRFMData,
-                        includeEngagementData=includeEngagementData)
-
-                except socket.timeout:
-                    retry_count += 1
-                    if retry_count >= 5:
-                        LOGGER.error("Retried more than five times, moving on!")
-                        raise
-                    LOGGER.warn("Timeout caught, retrying request")
-                    continue
-                except Fault as e:
-                    if '103' in e.message:
-                        LOGGER.warn("Got signed out - logging in again and retrying")
-                        self.login()
-                        continue
-                    else:
-                        raise
-
-                LOGGER.info("... {} results".format(len(results)))
-                extraction_time = singer.utils.now()
-                for result in results:
-                    result_dict = zeep.helpers.serialize_object(result, target_cls=dict)
-                    flattened = flatten(result_dict)
-                    singer.write_record(table, field_selector(flattened), time_extracted=extraction_time)
-
-                if len(results) == 0:
-                    hasMore = False
-
-                pageNumber = pageNumber + 1
-
-            self.state = incorporate(
-                self.state, table, self.REPLICATION_KEY,
-                start.replace(microsecond=0).isoformat())
-
-            save_state(self.state)
+        resume = get_checkpoint(self.state, table)
+        first_pages = {}
+
+        if resume is not None and \
+           get_last_record_value_for_table(self.state, table) == start:
+            # A previous run stopped part way through a window. Finish
+            # that window from its last written page, then carry on from
+            # its end. That page is read again, in case contacts moved
+            # between pages since.
+            window_start, window_end, page = resume
+            LOGGER.info('Resuming contacts modified from {} to {} at '
+                        'page {}.'.format(window_start, window_end, page))
+
+            first_pages[(window_start, window_end)] = page
+            windows = itertools.chain(
+                [(window_start, window_end)],
+                self.make_windows(window_end, timedelta(hours=6),
+                                  probe=self.probe))
+        else:
+            windows = self.make_windows(start, timedelta(hours=6),
+                                        probe=self.probe)
+
+        self.decode_pool = DecodePool.from_config(self.config)
+
+        try:
+            self.sync_windows(windows, options, first_pages)
+        finally:
+            if self.decode_pool is not None:
+                self.decode_pool.close()
+                self.decode_pool = None
 
         LOGGER.info("Done syncing contacts.")
+
+    def sync_windows(self, windows, options, first_pages={}):
+        workers = int(self.config.get('contact_window_workers', 1))
+        fetch_mode = self.config.get('contact_fetch_mode', 'threads')
+
+        if fetch_mode == 'async' and aio.is_available():
+            asyncio.run(self.sync_windows_async(windows, options, workers,
+                                                first_pages))
+        elif workers > 1:
+            self.sync_windows_concurrently(windows, options, workers,
+                                           first_pages)
+        else:
+            for start, end in windows:
+                LOGGER.info("Fetching contacts modified from {} to {}"
+                            .format(start, end))
+
+                window_started = time.time()
+                requested_at = datetime.now(pytz.utc)
+                rows = 0
+
+                for page, records in self.read_window(
+                        start, end, options,
+                        first_pages.get((start, end), 1)):
+                    count = self.write_page(
+                        records, time_extracted=singer.utils.now())
+                    LOGGER.info("... {} results".format(count))
+                    rows += count
+
+                    self.checkpoint(start, end, page)
+
+                self.window_planner.observe(end - start, rows,
+                                            time.time() - window_started)
+
+                self.finish_window(end, requested_at)
+
+    def probe(self, start, end):
+        # Only the count matters here, so leave out every optional section
+        # of the payload.
+        results = self.read_page(self.make_filter(start, end), 1,
+                                 ContactRequestPlan([]).options,
+                                 window=(start, end))
+
+        return sum(1 for _ in results)
+
+    def read_page(self, _filter, pageNumber, options, window=None):
+        return self.read_records(
+            'readContacts',
+            self.field_selector,
+            flatten=['readOnlyContactData'],
+            custom_fields=self.custom_fields,
+            window=window,
+            page=pageNumber,
+            filter=_filter,
+            pageNumber=pageNumber,
+            **options)
+
+    def read_window(self, start, end, options, first_page=1):
+        _filter = self.make_filter(start, end)
+
+        pageNumber = first_page
+        hasMore = True
+        while hasMore:
+            results = non_empty(
+                self.read_page(_filter, pageNumber, options,
+                               window=(start, end)))
+
+            if results is None:
+                LOGGER.info("... 0 results")
+                hasMore = False
+            else:
+                yield pageNumber, results
+
+            pageNumber = pageNumber + 1
+
+    def checkpoint(self, start, end, page):
+        self.state = incorporate_checkpoint(
+            self.state, self.TABLE, self.REPLICATION_KEY, start, end, page)
+
+        self.save_state()
+
+    def finish_window(self, end, requested_at):
+        # The last window reaches past now, so never bookmark beyond the
+        # moment its data was actually requested.
+        self.state = incorporate(
+            self.state, self.TABLE, self.REPLICATION_KEY,
+            min(end, requested_at).replace(microsecond=0).isoformat())
+
+        self.save_state()
+
+    def fetch_window(self, start, end, options, first_page=1):
+        LOGGER.info("Fetching contacts modified from {} to {}"
+                    .format(start, end))
+
+        window_started = time.time()
+        requested_at = datetime.now(pytz.utc)
+        # Pages of a window fetched ahead of time have to be held until
+        # every earlier window has been written.
+        with profiling.section(self.TABLE):
+            pages = [(page, singer.utils.now(), list(records))
+                     for page, records in self.read_window(
+                         start, end, options, first_page)]
+
+        return requested_at, time.time() - window_started, pages
+
+    def write_window(self, start, end, requested_at, elapsed, pages):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        rows = 0
+        while pages:
+            page, extraction_time, records = pages.pop(0)
+            count = self.write_page(records,
+                                    time_extracted=extraction_time)
+            LOGGER.info("... {} results".format(count))
+            rows += count
+
+            self.checkpoint(start, end, page)
+
+        self.window_planner.observe(end - start, rows, elapsed)
+
+        self.finish_window(end, requested_at)
+
+    def sync_windows_concurrently(self, windows, options, workers,
+                                  first_pages={}):
+        # Windows are fetched on a bounded pool but emitted strictly in
+        # order. The bookmark only moves once a window and every window
+        # before it have been written, so it is always safe to resume from.
+        pending = deque()
+
+        LOGGER.info('Fetching up to {} contact windows at a time.'
+                    .format(workers))
+
+        def emit_oldest():
+            start, end, future = pending.popleft()
+            self.write_window(start, end, *future.result())
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for start, end in windows:
+                    pending.append((start, end, executor.submit(
+                        self.fetch_window, start, end, options,
+                        first_pages.get((start, end), 1))))
+
+                    if len(pending) >= workers:
+                        emit_oldest()
+
+                while pending:
+                    emit_oldest()
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
+
+    async def read_window_async(self, transport, start, end, options,
+                                first_page=1):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        _filter = self.make_filter(start, end)
+
+        pageNumber = first_page
+        while True:
+            results = non_empty(await self.read_records_async(
+                transport,
+                'readContacts',
+                flatten=['readOnlyContactData'],
+                custom_fields=self.custom_fields,
+                window=(start, end),
+                page=pageNumber,
+                filter=_filter,
+                pageNumber=pageNumber,
+                **options))
+
+            if results is None:
+                LOGGER.info("... 0 results")
+                return
+
+            yield pageNumber, results
+
+            pageNumber = pageNumber + 1
+
+    async def fetch_window_async(self, transport, start, end, options,
+                                 first_page=1):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        LOGGER.info("Fetching contacts modified from {} to {}"
+                    .format(start, end))
+
+        window_started = time.time()
+        requested_at = datetime.now(pytz.utc)
+        # Pages stay raw until the window is written; only the first
+        # record of each is decoded, to find the end of the window.
+        pages = [(page, singer.utils.now(), records)
+                 async for page, records in self.read_window_async(
+                     transport, start, end, options, first_page)]
+
+        return requested_at, time.time() - window_started, pages
+
+    async def sync_windows_async(self, windows, options, workers,
+                                 first_pages={}):
+        # Like sync_windows_concurrently, but the windows are fetched as
+        # tasks on one event loop instead of on a pool of threads. Pages
+        # are decoded and written in order, as each window comes up.
+        pending = deque()
+
+        LOGGER.info('Fetching up to {} contact windows at a time, '
+                    'asynchronously.'.format(workers))
+
+        async def emit_oldest():
+            start, end, task = pending.popleft()
+            self.write_window(start, end, *(await task))
+
+        # Planning a window can call Bronto through the blocking request
+        # path (probe_empty_ranges), which would stall the loop that has
+        # to release the limiter slots it waits for. So the windows are
+        # drawn on a thread.
+        windows = iter(windows)
+
+        async with aio.AsyncTransport(self.config, workers) as transport:
+            try:
+                while True:
+                    window = await asyncio.to_thread(next, windows, None)
+                    if window is None:
+                        break
+
+                    start, end = window
+                    pending.append((start, end, asyncio.ensure_future(
+                        self.fetch_window_async(
+                            transport, start, end, options,
+                            first_pages.get((start, end), 1)))))
+
+                    if len(pending) >= workers:
+                        await emit_oldest()
+
+                while pending:
+                    await emit_oldest()
+            finally:
+                for _, _, task in pending:
+                    task.cancel()
@@ -1,9 +1,8 @@
-from tap_bronto.schemas import with_properties, get_field_selector
+from tap_bronto.schemas import get_field_selector, get_stream_definition
+from tap_bronto.output import write_schema, write_records
 from tap_bronto.stream import Stream
 
 import singer
-import zeep
-from zeep.exceptions import Fault
 
 LOGGER = singer.get_logger()  # noqa
 
@@ -11,32 +10,8 @@ LOGGER = singer.get_logger()  # noqa
 class ListStream(Stream):
 
     TABLE = 'list'
-    KEY_PROPERTIES = ['id']
-    SCHEMA, METADATA = with_properties({
-        'id': {
-            'type': ['string'],
-            'description': ('The unique id assigned to the list.')
-        },
-        'name': {
-            'type': ['string'],
-            'description': ('The internal name of the list.')
-        },
-        'label': {
-            'type': ['string'],
-            'description': ('The external (customer facing) name '
-                            'of the list. ')
-        },
-        'activeCount': {
-            'type': ['null', 'integer'],
-            'description': ('The number of active contacts of '
-                            'currently on the list.')
-        },
-        'status': {
-            'type': ['string'],
-            'description': ('The status of the list. Valid values '
-                            'are active, deleted, and tmp')
-        }
-    }, KEY_PROPERTIES, [])
+    KEY_PROPERTIES, REPLICATION_KEY, SCHEMA, METADATA = \
+        get_stream_definition(TABLE)
 
     def make_filter(self):
         _filter = self.factory['mailListFilter']
@@ -46,7 +21,7 @@ class ListStream(Stream):
         key_properties = self.catalog.get('key_properties')
         table = self.TABLE
 
-        singer.write_schema(
+        write_schema(
             self.catalog.get('stream'),
             self.catalog.get('schema'),
             key_properties=key_properties)
@@ -63,29 +38,21 @@ class ListStream(Stream):
         while hasMore:
 
             LOGGER.info("... page {}".format(pageNumber))
-            try:
-                results = self.client.service.readLists(
-                    filter=_filter,
-                    pageNumber=pageNumber,
-                    pageSize=5000)
-            except Fault as e:
-                if '103' in e.message:
-                    LOGGER.warn("Got signed out - logging in again and retrying")
-                    self.login()
-                    continue
-                else:
-                    raise
-
-            LOGGER.info("... {} results".format(len(results)))
+            results = self.read_records(
+                'readLists',
+                field_selector,
+                page=pageNumber,
+                filter=_filter,
+                pageNumber=pageNumber,
+                pageSize=5000)
 
             pageNumber = pageNumber + 1
 
-            singer.write_records(
-                table,
-                [field_selector(zeep.helpers.serialize_object(result, target_cls=dict))
-                 for result in results])
+            count = write_records(table, results)
 
-            if len(results) == 0:
+            LOGGER.info("... {} results".format(count))
+
+            if count == 0:
                 hasMore = False
 
         LOGGER.info("Done syncing lists.")
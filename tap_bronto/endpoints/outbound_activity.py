@@ -1,17 +1,18 @@
-from tap_bronto.schemas import get_field_selector, with_properties, ACTIVITY_SCHEMA
-from tap_bronto.state import incorporate, save_state, \
+from tap_bronto.dedup import DedupIndex
+from tap_bronto.ids import IdBuilder
+from tap_bronto.schemas import get_field_selector, get_stream_definition
+from tap_bronto.state import incorporate, \
     get_last_record_value_for_table
-from tap_bronto.stream import Stream
+from tap_bronto.output import write_schema, write_records
+from tap_bronto.stream import Stream, non_empty
 
 from datetime import datetime, timedelta
 from dateutil import parser
-from funcy import identity, project, filter
 from zeep.exceptions import Fault
 
-import hashlib
 import pytz
 import singer
-import zeep
+import time
 
 LOGGER = singer.get_logger()  # noqa
 
@@ -19,9 +20,8 @@ LOGGER = singer.get_logger()  # noqa
 class OutboundActivityStream(Stream):
 
     TABLE = 'outbound_activity'
-    REPLICATION_KEY = 'createdDate'
-    KEY_PROPERTIES = ['id']
-    SCHEMA, METADATA = with_properties(ACTIVITY_SCHEMA, KEY_PROPERTIES, [REPLICATION_KEY])
+    KEY_PROPERTIES, REPLICATION_KEY, SCHEMA, METADATA = \
+        get_stream_definition(TABLE)
 
     def make_filter(self, start, end):
         _filter = self.factory['recentOutboundActivitySearchRequest']
@@ -33,9 +33,9 @@ class OutboundActivityStream(Stream):
         earliest_available = datetime.now(pytz.utc) - timedelta(days=30)
 
         if earliest_available > start:
-            LOGGER.warn('Start date before 30 days ago, but Bronto '
-                        'only returns the past 30 days of activity. '
-                        'Using a start date of -30 days.')
+            LOGGER.warning('Start date before 30 days ago, but Bronto '
+                           'only returns the past 30 days of activity. '
+                           'Using a start date of -30 days.')
             return earliest_available
         else:
             LOGGER.info('Rewinding three days, since activities can change...')
@@ -46,73 +46,92 @@ class OutboundActivityStream(Stream):
         key_properties = self.catalog.get('key_properties')
         table = self.TABLE
 
-        singer.write_schema(
+        write_schema(
             self.catalog.get('stream'),
             self.catalog.get('schema'),
             key_properties=key_properties)
 
         start = self.get_start_date(table)
-        end = start
-        interval = timedelta(hours=1)
+
+        # A replay neither reads nor touches the index on disk, so it
+        # emits exactly what the recorded responses hold.
+        if self.is_replay():
+            dedup_index = DedupIndex(None, self.REPLICATION_KEY)
+        else:
+            dedup_index = DedupIndex.from_config(self.config, table,
+                                                 self.REPLICATION_KEY)
+
+        # Without a bookmark this is a fresh sync, so emit everything again.
+        bookmark = get_last_record_value_for_table(self.state, table)
+        if bookmark is None:
+            dedup_index.clear()
+        else:
+            dedup_index.rewind(bookmark)
+
+        dedup_index.prune(start)
 
         LOGGER.info('Syncing outbound activities.')
 
-        while end < datetime.now(pytz.utc):
-            start = end
-            end = start + interval
+        field_selector = get_field_selector(self.catalog,
+                                            self.catalog.get('schema'))
+
+        id_builder = IdBuilder.from_config(self.config)
+
+        for start, end in self.make_windows(start, timedelta(hours=1)):
             LOGGER.info("Fetching activities from {} to {}".format(
                 start, end))
 
-            _filter = self.make_filter(start, end)
-            field_selector = get_field_selector(self.catalog,
-                self.catalog.get('schema'))
+            window_started = time.time()
+            rows = 0
 
+            _filter = self.make_filter(start, end)
             hasMore = True
+            page = 1
 
             while hasMore:
                 try:
-                    results = \
-                        self.client.service.readRecentOutboundActivities(
-                            filter=_filter)
+                    parsed_results = self.read_records(
+                        'readRecentOutboundActivities', field_selector,
+                        window=(start, end), page=page, filter=_filter)
                 except Fault as e:
                     if '116' in e.message:
                         hasMore = False
                         break
-                    elif '103' in e.message:
-                        LOGGER.warn("Got signed out - logging in again and retrying")
-                        self.login()
-                        continue
                     else:
                         raise
 
-                result_dicts = [zeep.helpers.serialize_object(result, target_cls=dict)
-                                for result in results]
+                parsed_results = non_empty(parsed_results)
 
-                parsed_results = [field_selector(result)
-                                  for result in result_dicts]
+                if parsed_results is None:
+                    break
 
-                for result in parsed_results:
-                    ids = ['createdDate', 'activityType', 'contactId',
-                           'listId', 'segmentId', 'keywordId', 'messageId']
+                suppressed = dedup_index.suppressed
+                count = write_records(
+                    table, dedup_index.filter(
+                        id_builder.with_ids(parsed_results)))
+                suppressed = dedup_index.suppressed - suppressed
 
-                    result['id'] = hashlib.md5(
-                        '|'.join(filter(identity,
-                                        project(result, ids).values()))
-                        .encode('utf-8')).hexdigest()
-
-                singer.write_records(table, parsed_results)
-
-                LOGGER.info('... {} results'.format(len(results)))
+                LOGGER.info('... {} results'.format(count))
+                if suppressed:
+                    LOGGER.info('... {} already emitted, skipped'
+                                .format(suppressed))
+                rows += count + suppressed
 
                 _filter.readDirection = 'NEXT'
+                page += 1
 
-                if len(results) == 0:
-                    hasMore = False
+            self.window_planner.observe(end - start, rows,
+                                        time.time() - window_started)
 
             self.state = incorporate(
                 self.state, table, self.REPLICATION_KEY,
                 start.replace(microsecond=0).isoformat())
 
-            save_state(self.state)
+            self.save_state()
+            dedup_index.save()
+
+        if dedup_index.suppressed:
+            LOGGER.info('Skipped {} outbound activities that were already '
+                        'emitted.'.format(dedup_index.suppressed))
 
         LOGGER.info('Done syncing outbound activities.')
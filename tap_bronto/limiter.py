@@ -0,0 +1,178 @@
+import threading
+import time
+
+import singer
+
+from singer import metrics
+
+LOGGER = singer.get_logger()  # noqa
+
+# Never slow down below this many requests per second after throttling.
+MIN_REQUESTS_PER_SECOND = 0.1
+
+# Successful calls needed before limits that were lowered after throttling
+# are raised one step again.
+RECOVER_AFTER_CALLS = 20
+
+# How often callers that can't block check again for a free slot.
+POLL_SECONDS = 0.01
+
+
+class RateLimiter:  # pylint: disable=too-many-instance-attributes
+
+    # One limiter is shared by every stream and worker thread in a run.
+    # Calls take a token from a bucket refilled at `requests_per_second`
+    # (bursting up to one second's worth) and a slot out of
+    # `max_in_flight`. Either limit may be None for no limit. Throttling
+    # faults halve both, and they climb back while calls succeed.
+    def __init__(self, requests_per_second=None, max_in_flight=None):
+        self.target_rate = requests_per_second
+        self.rate = requests_per_second
+        self.max_in_flight = max_in_flight
+        self.in_flight_limit = max_in_flight
+
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+        self.waited = 0.0
+        self.calls = 0
+        self.throttles = 0
+        self.successes = 0
+
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config):
+        requests_per_second = config.get('max_requests_per_second')
+        max_in_flight = config.get('max_in_flight_requests')
+
+        return cls(
+            requests_per_second=float(requests_per_second)
+            if requests_per_second else None,
+            max_in_flight=int(max_in_flight) if max_in_flight else None)
+
+    @property
+    def burst(self):
+        return max(1.0, self.rate or 0.0)
+
+    def _refill(self, now):
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _take(self):
+        # Called with the condition held. Takes a token and a slot if both
+        # are free and returns None, otherwise returns how long to wait
+        # for a token, or 0 when only a released slot can help.
+        self._refill(time.monotonic())
+
+        has_slot = self.in_flight_limit is None or \
+            self.in_flight < self.in_flight_limit
+        has_token = self.rate is None or self.tokens >= 1
+
+        if not has_slot:
+            return 0
+        if not has_token:
+            return (1 - self.tokens) / self.rate
+
+        if self.rate is not None:
+            self.tokens -= 1
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.calls += 1
+
+        return None
+
+    def acquire(self):
+        # Blocks until the call may go ahead, and returns how long that
+        # took.
+        started = time.monotonic()
+
+        with self._condition:
+            while True:
+                timeout = self._take()
+
+                if timeout is None:
+                    break
+
+                self._condition.wait(timeout or None)
+
+            waited = time.monotonic() - started
+            self.waited += waited
+
+        return waited
+
+    def try_acquire(self, started):
+        # Like acquire(), but never blocks, for callers running on an
+        # event loop. Returns None once the call may go ahead, otherwise
+        # how long to sleep before trying again. `started` is when the
+        # caller first tried, so its wait is counted like acquire()'s.
+        with self._condition:
+            timeout = self._take()
+
+            if timeout is None:
+                self.waited += time.monotonic() - started
+                return None
+
+        return timeout or POLL_SECONDS
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def throttled(self):
+        with self._condition:
+            self.throttles += 1
+            self.successes = 0
+
+            if self.rate is not None:
+                self.rate = max(MIN_REQUESTS_PER_SECOND, self.rate / 2)
+                self.tokens = min(self.tokens, self.burst)
+
+            self.in_flight_limit = max(
+                1, (self.in_flight_limit or self.peak_in_flight) // 2)
+
+            LOGGER.warning('Bronto is throttling requests, slowing down '
+                           'to {} requests/sec and {} in flight.'
+                           .format('unlimited' if self.rate is None
+                                   else round(self.rate, 2),
+                                   self.in_flight_limit))
+
+    def succeeded(self):
+        with self._condition:
+            self.successes += 1
+
+            if self.successes < RECOVER_AFTER_CALLS:
+                return
+
+            self.successes = 0
+
+            if self.rate is not None and self.rate < self.target_rate:
+                self.rate = min(self.target_rate,
+                                self.rate + self.target_rate / 10)
+
+            # Without a configured cap, stop limiting once we're back to
+            # the concurrency we had before being throttled.
+            if self.in_flight_limit is not None and \
+               self.in_flight_limit != self.max_in_flight:
+                self.in_flight_limit += 1
+
+                if self.max_in_flight is None and \
+                   self.in_flight_limit >= self.peak_in_flight:
+                    self.in_flight_limit = None
+
+            self._condition.notify_all()
+
+    def report(self):
+        LOGGER.info('Waited {:.1f} seconds on the rate limiter over {} '
+                    'calls ({} throttling faults).'
+                    .format(self.waited, self.calls, self.throttles))
+
+        metrics.log(LOGGER, metrics.Point(
+            'timer', 'rate_limit_wait', self.waited,
+            {'calls': self.calls, 'throttles': self.throttles}))
@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+
+import singer
+
+from singer import metrics
+
+LOGGER = singer.get_logger()  # noqa
+
+_LOCK = threading.Lock()
+# The open metrics_log_path file, if any, under 'file'.
+_SIDECAR = {'file': None}
+_TOTALS = {'wire_bytes': 0, 'bytes': 0}
+
+
+def configure(config):
+    close()
+
+    with _LOCK:
+        _TOTALS.update(wire_bytes=0, bytes=0)
+
+        path = config.get('metrics_log_path')
+        if path:
+            # Stays open for the whole run, until close().
+            _SIDECAR['file'] = open(  # pylint: disable=consider-using-with
+                path, 'a', buffering=1)
+
+
+def close():
+    with _LOCK:
+        if _SIDECAR['file'] is not None:
+            _SIDECAR['file'].close()
+            _SIDECAR['file'] = None
+
+
+def report():
+    # How much the responses of the whole run took on the wire, against
+    # what they decompressed to.
+    with _LOCK:
+        wire_bytes, decoded_bytes = _TOTALS['wire_bytes'], _TOTALS['bytes']
+
+    LOGGER.info('Received {:.1f} MB over the wire, {:.1f} MB decoded.'
+                .format(wire_bytes / 1e6, decoded_bytes / 1e6))
+
+    metrics.log(LOGGER, metrics.Point(
+        'counter', 'response_bytes', decoded_bytes,
+        {'wire_bytes': wire_bytes}))
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+class RequestMetrics:  # pylint: disable=too-many-instance-attributes
+
+    # One SOAP call and the page it returned. Network time and response
+    # size come from the transport. Decode and write time are split out
+    # while the page's records are consumed, and everything is emitted
+    # once the page has been written.
+    def __init__(self, stream, operation, window=None, page=None,
+                 retries=0):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.stream = stream
+        self.operation = operation
+        self.window = window or (None, None)
+        self.page = page
+        self.retries = retries
+        self.status = 'succeeded'
+        self.error = None
+
+        self.wait_seconds = 0.0
+        self.latency = 0.0
+        self.wire_bytes = 0
+        self.bytes = 0
+        self.parse_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.write_seconds = 0.0
+        self.rows = 0
+
+    def asdict(self):
+        return {
+            'stream': self.stream,
+            'operation': self.operation,
+            'window_start': _isoformat(self.window[0]),
+            'window_end': _isoformat(self.window[1]),
+            'page': self.page,
+            'status': self.status,
+            'error': self.error,
+            'retries': self.retries,
+            'wait_seconds': round(self.wait_seconds, 6),
+            'latency': round(self.latency, 6),
+            'wire_bytes': self.wire_bytes,
+            'bytes': self.bytes,
+            'parse_seconds': round(self.parse_seconds, 6),
+            'decode_seconds': round(self.decode_seconds, 6),
+            'write_seconds': round(self.write_seconds, 6),
+            'rows': self.rows,
+        }
+
+    def emit(self):
+        tags = {
+            metrics.Tag.endpoint: self.operation,
+            metrics.Tag.status: self.status,
+            'error': self.error,
+            'stream': self.stream,
+            'window_start': _isoformat(self.window[0]),
+            'window_end': _isoformat(self.window[1]),
+            'page': self.page,
+            'retries': self.retries,
+            'wire_bytes': self.wire_bytes,
+            'bytes': self.bytes,
+            'wait_seconds': round(self.wait_seconds, 6),
+        }
+
+        metrics.log(LOGGER, metrics.Point(
+            'timer', metrics.Metric.http_request_duration,
+            self.latency, tags))
+
+        if self.status == 'succeeded':
+            metrics.log(LOGGER, metrics.Point(
+                'timer', 'decode_duration',
+                self.parse_seconds + self.decode_seconds, tags))
+            metrics.log(LOGGER, metrics.Point(
+                'timer', 'write_duration', self.write_seconds, tags))
+            metrics.log(LOGGER, metrics.Point(
+                'counter', metrics.Metric.record_count, self.rows, tags))
+
+        with _LOCK:
+            _TOTALS['wire_bytes'] += self.wire_bytes
+            _TOTALS['bytes'] += self.bytes
+
+            if _SIDECAR['file'] is not None:
+                _SIDECAR['file'].write(json.dumps(self.asdict()) + '\n')
+
+    def failed(self, error):
+        self.status = 'failed'
+        self.error = str(error)
+        self.emit()
+
+    def measure(self, records):
+        # Time spent inside next() is decoding; everything between two
+        # records is the caller selecting, enriching and writing them.
+        started = time.perf_counter()
+        records = iter(records)
+
+        while True:
+            decode_started = time.perf_counter()
+            try:
+                record = next(records)
+            except StopIteration:
+                break
+            finally:
+                self.decode_seconds += time.perf_counter() - decode_started
+
+            self.rows += 1
+            yield record
+
+        self.write_seconds = time.perf_counter() - started - \
+            self.decode_seconds
+        self.emit()
@@ -0,0 +1,190 @@
+import decimal
+import importlib
+import sys
+import threading
+import time
+
+import simplejson
+import singer
+
+LOGGER = singer.get_logger()  # noqa
+
+DEFAULT_OUTPUT_BUFFER_BYTES = 64 * 1024
+DEFAULT_OUTPUT_FLUSH_SECONDS = 1
+
+
+def encode_json(message):
+    # Exactly what singer.write_message produces.
+    return simplejson.dumps(message, use_decimal=True,
+                            ensure_ascii=True, allow_nan=False)
+
+
+def _default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+
+    raise TypeError('Type is not JSON serializable: {}'
+                    .format(type(value).__name__))
+
+
+def get_encoder(name=None):
+    if name in (None, 'json'):
+        return encode_json
+
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        LOGGER.warning('{} is not installed, falling back to json.'
+                       .format(name))
+        return encode_json
+
+    if name == 'orjson':
+        return lambda message: module.dumps(
+            message, default=_default).decode('utf-8')
+    elif name == 'ujson':
+        return lambda message: module.dumps(
+            message, ensure_ascii=True, default=_default)
+
+    raise ValueError('Unknown output_json_encoder: {}'.format(name))
+
+
+class Writer:  # pylint: disable=too-many-instance-attributes
+
+    # Lines are buffered and written to stdout in one go once the buffer
+    # holds `buffer_bytes` characters, or when a message is written more
+    # than `flush_seconds` after the last flush. There is no timer: while
+    # the tap waits on Bronto nothing is written, so nothing is flushed.
+    # A buffer size of 0 writes every message immediately, like
+    # singer.write_message.
+    def __init__(self, encoder=None, buffer_bytes=0, flush_seconds=0,
+                 out=None):
+        self.encode = encoder or encode_json
+        self.buffer_bytes = buffer_bytes
+        self.flush_seconds = flush_seconds
+        self.out = out
+        self.buffer = []
+        self.buffered = 0
+        self.flushed_at = time.monotonic()
+        self.lock = threading.RLock()
+
+    def write(self, message, force=False):
+        line = self.encode(message) + '\n'
+
+        # Streams may sync on several threads at once. Lines are only
+        # appended under the lock, so they never interleave.
+        with self.lock:
+            self.buffer.append(line)
+            self.buffered += len(line)
+
+            if force or self.buffered >= self.buffer_bytes or \
+               time.monotonic() - self.flushed_at >= self.flush_seconds:
+                self._flush()
+
+    def write_lines(self, lines):
+        # Lines that were already encoded, e.g. by a decode worker.
+        count = 0
+
+        with self.lock:
+            for line in lines:
+                self.buffer.append(line)
+                self.buffered += len(line)
+                count += 1
+
+            if self.buffered >= self.buffer_bytes or \
+               time.monotonic() - self.flushed_at >= self.flush_seconds:
+                self._flush()
+
+        return count
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        out = self.out or sys.stdout
+
+        if self.buffer:
+            out.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+        out.flush()
+        self.flushed_at = time.monotonic()
+
+
+_WRITER = Writer()
+
+
+def configure(config):
+    # Swapped rather than reconfigured in place, so a writer never runs
+    # with half its settings changed.
+    global _WRITER  # pylint: disable=global-statement
+
+    flush()
+
+    _WRITER = Writer(
+        encoder=get_encoder(config.get('output_json_encoder')),
+        buffer_bytes=int(config.get('output_buffer_bytes',
+                                    DEFAULT_OUTPUT_BUFFER_BYTES)),
+        flush_seconds=float(config.get('output_flush_seconds',
+                                       DEFAULT_OUTPUT_FLUSH_SECONDS)))
+
+
+def flush():
+    _WRITER.flush()
+
+
+def write_schema(stream_name, schema, key_properties):
+    _WRITER.write(singer.SchemaMessage(
+        stream=stream_name,
+        schema=schema,
+        key_properties=key_properties).asdict())
+
+
+def write_record(stream_name, record, time_extracted=None):
+    _WRITER.write(singer.RecordMessage(
+        stream=stream_name,
+        record=record,
+        time_extracted=time_extracted).asdict())
+
+
+def write_records(stream_name, records, time_extracted=None):
+    # Build the envelope once per page and swap the record in, instead of
+    # formatting time_extracted again for every row.
+    message = singer.RecordMessage(
+        stream=stream_name,
+        record=None,
+        time_extracted=time_extracted).asdict()
+    count = 0
+
+    for record in records:
+        message['record'] = record
+        _WRITER.write(message)
+        count += 1
+
+    return count
+
+
+def encode_records(stream_name, records, time_extracted=None,
+                   encoder=encode_json):
+    message = singer.RecordMessage(
+        stream=stream_name,
+        record=None,
+        time_extracted=time_extracted).asdict()
+    lines = []
+
+    for record in records:
+        message['record'] = record
+        lines.append(encoder(message) + '\n')
+
+    return lines
+
+
+def write_lines(lines):
+    return _WRITER.write_lines(lines)
+
+
+def write_state(state):
+    # Everything buffered so far is covered by this state, so it goes out
+    # together with it.
+    _WRITER.write(singer.StateMessage(value=state).asdict(), force=True)
@@ -0,0 +1,186 @@
+import cProfile
+import pstats
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+import singer
+
+LOGGER = singer.get_logger()  # noqa
+
+DEFAULT_PROFILE_PATH = 'tap-bronto.prof'
+DEFAULT_PROFILE_TOP = 25
+
+_LOCK = threading.Lock()
+_LOCAL = threading.local()
+# Whether a run is being profiled, and whether its sections have had to
+# share one profiler.
+_RUN = {'active': False, 'shared': False}
+_STATS = {}
+_ELAPSED = {}
+
+
+def _key(function):
+    code = function.__code__
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def get_phases():
+    # Each phase is the cumulative time of the functions doing that work.
+    # Builtins have no code object, so they are matched by name instead.
+    # Imported here so that only a profiled run pays for them.
+    # pylint: disable=import-outside-toplevel
+    from tap_bronto.decode import RecordDecoder
+    from tap_bronto.ids import IdBuilder
+    from tap_bronto.output import Writer
+    from tap_bronto.schemas import FieldSelector
+    from tap_bronto.session import MeasuredTransport, SessionManager
+    from zeep.helpers import serialize_object
+    from zeep.wsdl.bindings.soap import SoapBinding
+
+    return [
+        ('login', [_key(SessionManager.login)]),
+        ('fetch', [_key(MeasuredTransport.post)]),
+        ('parse', [_key(SoapBinding.process_reply)]),
+        ('serialize_object', [_key(serialize_object)]),
+        ('decode', [_key(RecordDecoder.decode)]),
+        ('select', [_key(FieldSelector.__call__)]),
+        ('ids', [_key(IdBuilder.__call__)]),
+        ('write', [_key(Writer.write), _key(Writer.flush)]),
+    ]
+
+
+def phase_seconds(stats, functions):
+    seconds = 0.0
+
+    for (filename, line, name), (_, _, _, cumulative, _) in \
+            stats.stats.items():
+        for function in functions:
+            if isinstance(function, tuple):
+                matched = function == (filename, line, name)
+            else:
+                matched = filename == '~' and function in name
+
+            if matched:
+                seconds += cumulative
+
+    return seconds
+
+
+def _enable(profile):
+    # Before Python 3.12 cProfile only watches the thread that enabled it,
+    # and every thread can run its own. From 3.12 only one profiler can
+    # be active in the whole process, and it sees every thread. A section
+    # that can't start its own is then only timed, and its calls are
+    # counted by whichever profiler is running.
+    try:
+        profile.enable()
+    except ValueError:
+        with _LOCK:
+            if not _RUN['shared']:
+                _RUN['shared'] = True
+                LOGGER.info('Another thread is already profiling, so '
+                            'sections share one profiler from here on.')
+        return None
+
+    return profile
+
+
+def _push(label):
+    stack = _LOCAL.__dict__.setdefault('stack', [])
+
+    # Only one profiler can be active per thread, so pause the enclosing
+    # one.
+    if stack and stack[-1][1] is not None:
+        stack[-1][1].disable()
+
+    stack.append((label, _enable(cProfile.Profile()), time.perf_counter()))
+
+
+def _pop():
+    stack = _LOCAL.stack
+    label, profile, started = stack.pop()
+    if profile is not None:
+        profile.disable()
+
+    with _LOCK:
+        _ELAPSED[label] = _ELAPSED.get(label, 0.0) + \
+            time.perf_counter() - started
+
+        if profile is not None and label in _STATS:
+            _STATS[label].add(profile)
+        elif profile is not None:
+            _STATS[label] = pstats.Stats(profile, stream=sys.stderr)
+
+    # If another thread took over meanwhile, the enclosing section keeps
+    # what it has recorded so far.
+    if stack and stack[-1][1] is not None:
+        _enable(stack[-1][1])
+
+
+@contextmanager
+def section(label):
+    if not _RUN['active']:
+        yield
+        return
+
+    _push(label)
+    try:
+        yield
+    finally:
+        _pop()
+
+
+def start():
+    _STATS.clear()
+    _ELAPSED.clear()
+    _RUN.update(active=True, shared=False)
+
+    _push('main')
+
+
+def stop(path=DEFAULT_PROFILE_PATH, top=DEFAULT_PROFILE_TOP):
+    _pop()
+    _RUN['active'] = False
+
+    combined = pstats.Stats(stream=sys.stderr)
+    combined.add(*_STATS.values())
+
+    combined.dump_stats(path)
+
+    print_summary(path, combined, top)
+
+
+def print_summary(path, combined, top):
+    phases = get_phases()
+    header = ['section', 'seconds'] + [name for name, _ in phases]
+    rows = [header]
+
+    # Sections that only shared another thread's profiler have a time but
+    # no phases of their own.
+    sections = [(label, _STATS.get(label)) for label in _ELAPSED]
+    for label, stats in sections + [('total', combined)]:
+        seconds = _ELAPSED.get(label, _ELAPSED.get('main', 0.0))
+        rows.append([label, '{:.2f}'.format(seconds)] + [
+            '{:.2f}'.format(phase_seconds(stats, functions))
+            if stats is not None else '-'
+            for _, functions in phases])
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+
+    # Stdout carries the Singer messages, so the summary goes to stderr.
+    out = sys.stderr
+    out.write('\nProfile written to {}. Seconds per phase '
+              '(cumulative, threads added together):\n\n'.format(path))
+    if _RUN['shared']:
+        out.write('Sections on other threads shared one profiler, so '
+                  'their calls are counted in the section that was '
+                  'profiling at the time.\n\n')
+    for row in rows:
+        out.write('  '.join(cell.rjust(width)
+                            for cell, width in zip(row, widths)) + '\n')
+    out.write('\n')
+
+    combined.sort_stats('cumulative').print_stats(top)
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+
+import singer
+
+from tap_bronto import profiling
+
+LOGGER = singer.get_logger()  # noqa
+
+
+def sync_stream(stream_accessor):
+    try:
+        if stream_accessor.shared_state is not None:
+            stream_accessor.state = stream_accessor.shared_state.snapshot()
+
+        with profiling.section(stream_accessor.TABLE):
+            stream_accessor.login()
+            stream_accessor.sync()
+
+    except Exception as exception:
+        LOGGER.error(exception)
+        LOGGER.error('Failed to sync endpoint, moving on!')
+        raise exception
+
+
+def sync_streams(stream_accessors, max_concurrent_streams=1):
+    if max_concurrent_streams <= 1 or len(stream_accessors) <= 1:
+        for stream_accessor in stream_accessors:
+            sync_stream(stream_accessor)
+        return
+
+    LOGGER.info('Syncing {} streams, up to {} at a time.'
+                .format(len(stream_accessors), max_concurrent_streams))
+
+    with ThreadPoolExecutor(max_workers=max_concurrent_streams) as executor:
+        futures = [executor.submit(sync_stream, stream_accessor)
+                   for stream_accessor in stream_accessors]
+
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+
+        for future in not_done:
+            future.cancel()
+
+        for future in done:
+            future.result()
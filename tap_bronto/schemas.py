@@ -1,5 +1,3 @@
-from funcy import project
-
 from datetime import datetime
 from singer import metadata
 
@@ -31,30 +29,65 @@ def is_selected(catalog, field=None):
     if not field:
         return mdata.get((), {}).get('selected')
     else:
-        # TODO: Fix logic for selected
-        field_metadata = mdata.get(('properties', field), {})
-        return field_metadata.get('selected', False) or field_metadata.get('inclusion', False) == 'automatic'
+        return is_field_selected(mdata, field)
 
-def get_field_selector(catalog, schema):
-    selections = []
+def is_field_selected(mdata, field):
+    # TODO: Fix logic for selected
+    field_metadata = mdata.get(('properties', field), {})
+    return field_metadata.get('selected', False) or field_metadata.get('inclusion', False) == 'automatic'
 
-    for field, schema in schema.get('properties').items():
-        if is_selected(catalog, field):
-            selections.append(field)
+def get_selected_fields(catalog, schema):
+    mdata = metadata.to_map(catalog.get('metadata'))
 
-    def select(data):
-        to_return = {}
+    return [field for field in schema.get('properties')
+            if is_field_selected(mdata, field)]
+
+
+def to_string(value):
+    if isinstance(value, datetime):
+        return value.replace(microsecond=0).isoformat()
+
+    return value
+
+
+def get_converter(field_schema):
+    # Only string fields can hold the datetimes zeep hands back, so every
+    # other declared type is passed through untouched.
+    types = field_schema.get('type')
+
+    if isinstance(types, str):
+        types = [types]
+
+    if types and 'string' not in types:
+        return None
+
+    return to_string
+
+
+class FieldSelector:  # pylint: disable=too-few-public-methods
+
+    def __init__(self, catalog, schema):
+        properties = schema.get('properties')
+
+        self.fields = tuple(get_selected_fields(catalog, schema))
+        self.converters = tuple(
+            (field, get_converter(properties[field]))
+            for field in self.fields)
 
-        for k, v in project(data, selections).items():
-            if isinstance(v, datetime):
-                to_return[k] = v.replace(microsecond=0).isoformat()
+    def __call__(self, data):
+        to_return = {}
 
-            else:
-                to_return[k] = v
+        for field, convert in self.converters:
+            if field in data:
+                value = data[field]
+                to_return[field] = value if convert is None \
+                    else convert(value)
 
         return to_return
 
-    return select
+
+def get_field_selector(catalog, schema):
+    return FieldSelector(catalog, schema)
 
 
 ACTIVITY_SCHEMA = {
@@ -502,3 +535,107 @@ CONTACT_SCHEMA = {
                         'for the contact.')
     }
 }
+
+LIST_SCHEMA = {
+    'id': {
+        'type': ['string'],
+        'description': ('The unique id assigned to the list.')
+    },
+    'name': {
+        'type': ['string'],
+        'description': ('The internal name of the list.')
+    },
+    'label': {
+        'type': ['string'],
+        'description': ('The external (customer facing) name '
+                        'of the list. ')
+    },
+    'activeCount': {
+        'type': ['null', 'integer'],
+        'description': ('The number of active contacts of '
+                        'currently on the list.')
+    },
+    'status': {
+        'type': ['string'],
+        'description': ('The status of the list. Valid values '
+                        'are active, deleted, and tmp')
+    }
+}
+
+UNSUBSCRIBE_SCHEMA = {
+    'contactId': {
+        'type': ['string'],
+        'description': ('The unique ID of the contact associated '
+                        'with the unsubscribe.')
+    },
+    'method': {
+        'type': ['string'],
+        'description': ('The method used by the contact to '
+                        'unsubscribe. The valid methods are: '
+                        'subscriber, admin, bulk, listcleaning, '
+                        'fbl (Feedback loop), complaint, '
+                        'account, api')
+    },
+    'deliveryId': {
+        'type': ['null', 'string'],
+        'description': ('The unique ID of the delivery that '
+                        'resulted in the contact unsubscribing.')
+    },
+    'complaint': {
+        'type': ['null', 'string'],
+        'description': ('Optional additional information about the '
+                        'unsubscribe.')
+    },
+    'created': {
+        'type': ['string'],
+        'description': 'The date/time the unsubscribe was created.'
+    }
+}
+
+# Every stream as (table, key properties, replication key, properties), in
+# the order discovery lists them. The endpoint classes take their keys and
+# schemas from here, so discovery never has to import them (or zeep).
+STREAMS = [
+    ('contact', ['id'], 'modified', CONTACT_SCHEMA),
+    ('inbound_activity', ['id'], 'createdDate', ACTIVITY_SCHEMA),
+    ('list', ['id'], None, LIST_SCHEMA),
+    ('outbound_activity', ['id'], 'createdDate', ACTIVITY_SCHEMA),
+    ('unsubscribe', ['contactId', 'method', 'created'], 'created',
+     UNSUBSCRIBE_SCHEMA),
+]
+
+
+def _definition(key_properties, replication_key, properties):
+    replication_keys = [replication_key] if replication_key else []
+    schema, mdata = with_properties(properties, key_properties,
+                                    replication_keys)
+
+    return key_properties, replication_key, schema, mdata
+
+
+# Built once, at import: {table: (key properties, replication key,
+# schema, metadata)}.
+STREAM_DEFINITIONS = {
+    table: _definition(key_properties, replication_key, properties)
+    for table, key_properties, replication_key, properties in STREAMS
+}
+
+
+def get_stream_definition(table):
+    return STREAM_DEFINITIONS[table]
+
+
+def catalog_entry(table):
+    key_properties, _, schema, mdata = STREAM_DEFINITIONS[table]
+
+    return {
+        'tap_stream_id': table,
+        'stream': table,
+        'key_properties': key_properties,
+        'schema': schema,
+        'metadata': mdata
+    }
+
+
+def generate_catalog():
+    return [catalog_entry(table) for table, _, _, _ in STREAMS]
@@ -0,0 +1,205 @@
+import copy
+import sys
+import threading
+import time
+import zlib
+
+import requests
+import singer
+import zeep
+
+from requests.adapters import HTTPAdapter
+from tap_bronto.wsdl_cache import get_wsdl_cache
+from zeep.exceptions import Fault
+from zeep.transports import Transport
+
+BRONTO_WSDL = 'https://api.bronto.com/v4?wsdl'
+WSDL_NAMESPACE = 'http://api.bronto.com/v4'
+
+# Bronto expires sessions after 20 minutes without a call, so refresh a
+# little before that instead of waiting for a fault 103.
+DEFAULT_SESSION_REFRESH_SECONDS = 15 * 60
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_HTTP_CONNECT_TIMEOUT = 30
+DEFAULT_HTTP_READ_TIMEOUT = 300
+
+LOGGER = singer.get_logger()  # noqa
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(config):
+    # Parsing the WSDL is expensive, so keep one parsed client per WSDL
+    # location and hand out shallow copies. Each copy gets its own default
+    # soap headers, but shares the parsed document and transport.
+    wsdl = config.get('wsdl') or BRONTO_WSDL
+
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(wsdl)
+
+        if client is None:
+            LOGGER.info('Loading WSDL from {}'.format(wsdl))
+            transport = Transport(cache=get_wsdl_cache(config))
+            client = zeep.Client(wsdl, transport=transport)
+            _CLIENTS[wsdl] = client
+
+    return copy.copy(client)
+
+
+def get_accept_encoding(config):
+    # SOAP replies are verbose XML and shrink several times over when
+    # compressed, so ask for gzip unless told not to.
+    if config.get('http_compression', True):
+        return 'gzip, deflate'
+
+    return 'identity'
+
+
+def get_http_timeouts(config):
+    # (connect, read) seconds, as requests and zeep take them. 0 waits
+    # forever.
+    connect = float(config.get('http_connect_timeout',
+                               DEFAULT_HTTP_CONNECT_TIMEOUT))
+    read = float(config.get('http_read_timeout', DEFAULT_HTTP_READ_TIMEOUT))
+
+    return (connect or None, read or None)
+
+
+def make_decompressor(encoding):
+    # An incremental decoder for a Content-Encoding, or None when the
+    # body isn't compressed. gzip and zlib streams are told apart by
+    # their header.
+    if encoding in ('gzip', 'x-gzip', 'deflate'):
+        return zlib.decompressobj(zlib.MAX_WBITS | 32)
+
+    return None
+
+
+def make_http_session(config):
+    pool_size = int(config.get('http_pool_size', DEFAULT_HTTP_POOL_SIZE))
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = get_accept_encoding(config)
+
+    return session
+
+
+class MeasuredTransport(Transport):
+
+    # Remembers how long the last POST made on each thread took, how many
+    # bytes came over the wire and how many they decompressed to, so
+    # callers can tell network time apart from the time zeep spends
+    # parsing the reply. urllib3 decompresses the body chunk by chunk as
+    # it is read, so a compressed page is never held twice.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.measurements = threading.local()
+
+    def post(self, address, message, headers):
+        started = time.perf_counter()
+        response = super().post(address, message, headers)
+
+        self.measurements.latency = time.perf_counter() - started
+        self.measurements.bytes = len(response.content)
+        self.measurements.wire_bytes = response.raw.tell() \
+            if response.raw is not None else self.measurements.bytes
+
+        return response
+
+    def last_request(self):
+        return (getattr(self.measurements, 'latency', 0.0),
+                getattr(self.measurements, 'wire_bytes', 0),
+                getattr(self.measurements, 'bytes', 0))
+
+
+class SessionManager:  # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, config, rate_limiter=None):
+        self.config = config
+        self.rate_limiter = rate_limiter
+        self.refresh_seconds = int(config.get(
+            'session_refresh_seconds', DEFAULT_SESSION_REFRESH_SECONDS))
+
+        self.client = None
+        self.factory = None
+        self.session_id = None
+        self.logged_in_at = None
+        self.last_used_at = None
+        self.login_count = 0
+
+        self._lock = threading.RLock()
+
+    def _build_client(self):
+        client = get_client(self.config)
+        client.transport = MeasuredTransport(
+            cache=client.transport.cache,
+            session=make_http_session(self.config),
+            operation_timeout=get_http_timeouts(self.config))
+
+        self.client = client
+        self.factory = client.type_factory(WSDL_NAMESPACE)
+
+    def is_stale(self):
+        if self.session_id is None:
+            return True
+
+        if not self.refresh_seconds:
+            return False
+
+        return time.time() - self.last_used_at >= self.refresh_seconds
+
+    def login(self):
+        with self._lock:
+            if self.client is None:
+                self._build_client()
+
+            LOGGER.info("Logging in")
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                session_id = self.client.service.login(
+                    self.config.get('token'))
+            except Fault:
+                LOGGER.fatal("Login failed!")
+                sys.exit(1)
+            finally:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.release()
+
+            session_header = self.client.get_element(
+                "{%s}sessionHeader" % WSDL_NAMESPACE)
+            self.client.set_default_soapheaders(
+                [session_header(sessionId=session_id)])
+
+            self.session_id = session_id
+            self.logged_in_at = self.last_used_at = time.time()
+            self.login_count += 1
+
+    def ensure_client(self):
+        with self._lock:
+            if self.client is None:
+                self._build_client()
+
+    def expire(self, session_id):
+        # Several threads can be signed out at once. Only drop the session
+        # they were using, not one another thread has already replaced it
+        # with; the next ensure_session logs in again.
+        with self._lock:
+            if session_id == self.session_id:
+                self.session_id = None
+
+    def ensure_session(self):
+        with self._lock:
+            if self.is_stale():
+                if self.session_id is not None:
+                    LOGGER.info('Session idle for over {} seconds, '
+                                'refreshing.'.format(self.refresh_seconds))
+                self.login()
+
+    def touch(self):
+        self.last_used_at = time.time()
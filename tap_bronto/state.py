@@ -1,9 +1,14 @@
+import copy
 import json
+import threading
 from dateutil.parser import parse
 
+import pytz
 import singer
 
-from voluptuous import Schema, Required
+from tap_bronto.output import write_state
+
+from voluptuous import Schema, Required, Optional
 
 LOGGER = singer.get_logger()
 
@@ -12,6 +17,11 @@ STATE_SCHEMA = Schema({
         str: {
             Required('last_record'): str,
             Required('field'): str,
+            Optional('checkpoint'): {
+                Required('window_start'): str,
+                Required('window_end'): str,
+                Required('page'): int,
+            },
         }
     }
 })
@@ -36,8 +46,7 @@ def incorporate(state, table, field, value):
 
     parsed = parse(value).strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    if 'bookmarks' not in new_state:
-        new_state['bookmarks'] = {}
+    new_state['bookmarks'] = dict(new_state.get('bookmarks', {}))
 
     if(new_state['bookmarks'].get(table, {}).get('last_record') is None or
        new_state['bookmarks'].get(table, {}).get('last_record') < value):
@@ -49,6 +58,42 @@ def incorporate(state, table, field, value):
     return new_state
 
 
+def get_checkpoint(state, table):
+    checkpoint = state.get('bookmarks', {}) \
+                      .get(table, {}) \
+                      .get('checkpoint')
+
+    if checkpoint is None:
+        return None
+
+    return (parse(checkpoint['window_start']),
+            parse(checkpoint['window_end']),
+            checkpoint['page'])
+
+
+def incorporate_checkpoint(state, table, field, window_start, window_end,
+                           page):
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    # Progress inside a window: the bookmark stays at the window start,
+    # and the checkpoint records the last page written. The next
+    # incorporate moves the bookmark past the window and drops it.
+    new_state = state.copy()
+
+    new_state['bookmarks'] = dict(new_state.get('bookmarks', {}))
+    new_state['bookmarks'][table] = {
+        'field': field,
+        'last_record': window_start.astimezone(pytz.utc)
+                                   .strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'checkpoint': {
+            'window_start': window_start.isoformat(),
+            'window_end': window_end.isoformat(),
+            'page': page,
+        },
+    }
+
+    return new_state
+
+
 def save_state(state):
     if not state:
         return
@@ -57,7 +102,38 @@ def save_state(state):
 
     LOGGER.info('Updating state.')
 
-    singer.write_state(state)
+    write_state(state)
+
+
+def merge_state(state, other):
+    # Bookmarks only ever move forward: for each table, keep whichever
+    # side has the later last_record.
+    merged = copy.deepcopy(state)
+    bookmarks = merged.setdefault('bookmarks', {})
+
+    for table, bookmark in other.get('bookmarks', {}).items():
+        current = bookmarks.get(table, {}).get('last_record')
+
+        if current is None or current <= bookmark.get('last_record'):
+            bookmarks[table] = copy.deepcopy(bookmark)
+
+    return merged
+
+
+class SharedState:
+
+    def __init__(self, state):
+        self.state = copy.deepcopy(state)
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            return copy.deepcopy(self.state)
+
+    def save(self, state):
+        with self._lock:
+            self.state = merge_state(self.state, state)
+            save_state(self.state)
 
 
 def load_state(filename):
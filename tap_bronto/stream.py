@@ -1,30 +1,324 @@
+import asyncio
+import collections
+import itertools
+import pytz
+import random
+import requests
 import singer
-import zeep
-import sys
+import socket
+import threading
+import time
 
+from datetime import datetime, timedelta
 from singer import metadata
-from tap_bronto.state import get_last_record_value_for_table
+from tap_bronto.decode import RecordDecoder, build_return_spec, \
+    decode_results, parse_raw_response, send_raw
+from tap_bronto.limiter import RateLimiter
+from tap_bronto.metrics import RequestMetrics
+from tap_bronto.output import write_lines, write_records
+from tap_bronto.schemas import catalog_entry, get_selected_fields
+from tap_bronto.session import SessionManager, BRONTO_WSDL, WSDL_NAMESPACE
+from tap_bronto.state import get_last_record_value_for_table, save_state
 from dateutil import parser
-from zeep.exceptions import Fault
-
-BRONTO_WSDL = 'https://api.bronto.com/v4?wsdl'
-WSDL_NAMESPACE = 'http://api.bronto.com/v4'
+from zeep.exceptions import Fault, TransportError
 
 LOGGER = singer.get_logger()  # noqa
 
+DEFAULT_WINDOW_MIN_SECONDS = 5 * 60
+DEFAULT_WINDOW_MAX_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_WINDOW_TARGET_ROWS = 5000
+DEFAULT_WINDOW_TARGET_SECONDS = 60
+DEFAULT_PROBE_SPAN_DAYS = 30
+DEFAULT_PROBE_DENSE_ROWS = 500
+
+# Never grow or shrink a window by more than this factor in one step, so a
+# single unusual window can't swing the plan too far.
+MAX_WINDOW_STEP = 4.0
+
+# Retries allowed per request for each class of error, and the delay the
+# backoff starts from. Session faults are fixed by logging in again, so
+# they are retried right away.
+DEFAULT_RETRY_BUDGETS = {
+    'session': 3,
+    'network': 5,
+    'throttle': 10,
+    'server': 5,
+}
+DEFAULT_RETRY_BASE_DELAYS = {
+    'session': 0.0,
+    'network': 1.0,
+    'throttle': 2.0,
+    'server': 1.0,
+}
+DEFAULT_RETRY_MAX_DELAY = 60
+# Retries allowed within any `DEFAULT_RETRY_BUDGET_CALLS` calls in a row,
+# across the run. Session faults are left out: they are bounded per
+# request and come back on every session expiry of a long run.
+DEFAULT_RETRY_TOTAL_BUDGET = 200
+DEFAULT_RETRY_BUDGET_CALLS = 1000
+DEFAULT_RETRY_BREAKER_FAILURES = 10
+DEFAULT_RETRY_BREAKER_SECONDS = 60
+
+SESSION_FAULTS = ['103']
+THROTTLE_FAULTS = ['109']
+
+
+def non_empty(records):
+    # Pull the first record off a lazy page, so callers can tell whether
+    # the page was empty without materializing the rest of it.
+    records = iter(records)
+    first = next(records, None)
+
+    if first is None:
+        return None
+
+    return itertools.chain([first], records)
+
+
+class WindowPlanner:
+
+    def __init__(self, interval, *, adaptive=False,
+                 min_interval=None, max_interval=None,
+                 target_rows=DEFAULT_WINDOW_TARGET_ROWS,
+                 target_seconds=DEFAULT_WINDOW_TARGET_SECONDS):
+        # pylint: disable=too-many-arguments
+        self.interval = interval
+        self.adaptive = adaptive
+        self.min_interval = min_interval or \
+            timedelta(seconds=DEFAULT_WINDOW_MIN_SECONDS)
+        self.max_interval = max_interval or \
+            timedelta(seconds=DEFAULT_WINDOW_MAX_SECONDS)
+        self.target_rows = target_rows
+        self.target_seconds = target_seconds
+        self.window_count = 0
+
+    @classmethod
+    def from_config(cls, config, interval):
+        return cls(
+            interval,
+            adaptive=bool(config.get('adaptive_windows', False)),
+            min_interval=timedelta(seconds=int(config.get(
+                'window_min_seconds', DEFAULT_WINDOW_MIN_SECONDS))),
+            max_interval=timedelta(seconds=int(config.get(
+                'window_max_seconds', DEFAULT_WINDOW_MAX_SECONDS))),
+            target_rows=int(config.get(
+                'window_target_rows', DEFAULT_WINDOW_TARGET_ROWS)),
+            target_seconds=float(config.get(
+                'window_target_seconds', DEFAULT_WINDOW_TARGET_SECONDS)))
+
+    def windows(self, start, until=None):
+        # Without an upper bound, keep going until a window reaches past
+        # now. Bounded spans are cut off exactly at `until`.
+        end = start
+
+        while end < (until or datetime.now(pytz.utc)):
+            start = end
+            end = start + self.interval
+
+            if until is not None:
+                end = min(end, until)
+
+            self.window_count += 1
+            yield start, end
+
+    def observe(self, interval, rows, elapsed):
+        if not self.adaptive:
+            return
+
+        if rows:
+            factor = self.target_rows / rows
+        else:
+            factor = MAX_WINDOW_STEP
+
+        if self.target_seconds and elapsed > self.target_seconds:
+            factor = min(factor, self.target_seconds / elapsed)
+
+        factor = max(1 / MAX_WINDOW_STEP, min(MAX_WINDOW_STEP, factor))
+
+        planned = max(self.min_interval,
+                      min(self.max_interval, interval * factor))
+
+        LOGGER.info('Window planner: {} rows in {:.2f}s over {}, next '
+                    'window {}.'.format(rows, elapsed, interval, planned))
+
+        self.interval = planned
+
+
+class RetryPolicy:  # pylint: disable=too-many-instance-attributes
+
+    # Shared by every stream in a run, so the total budget and the
+    # circuit breaker see all calls made to Bronto. The total budget is a
+    # rate: at most `total_budget` retries within the last `budget_calls`
+    # calls, so a long run isn't failed by errors spread over days.
+    def __init__(self, budgets=None, base_delays=None, *,
+                 max_delay=DEFAULT_RETRY_MAX_DELAY,
+                 total_budget=DEFAULT_RETRY_TOTAL_BUDGET,
+                 budget_calls=DEFAULT_RETRY_BUDGET_CALLS,
+                 breaker_failures=DEFAULT_RETRY_BREAKER_FAILURES,
+                 breaker_seconds=DEFAULT_RETRY_BREAKER_SECONDS):
+        # pylint: disable=too-many-arguments
+        self.budgets = dict(DEFAULT_RETRY_BUDGETS, **(budgets or {}))
+        self.base_delays = dict(DEFAULT_RETRY_BASE_DELAYS,
+                                **(base_delays or {}))
+        self.max_delay = max_delay
+        self.total_budget = total_budget
+        self.budget_calls = budget_calls
+        self.breaker_failures = breaker_failures
+        self.breaker_seconds = breaker_seconds
+
+        # Numbered calls, and the numbers of the calls that were retried
+        # within the last `budget_calls` of them.
+        self.calls = 0
+        self.retried_calls = collections.deque()
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            budgets=config.get('retry_budgets'),
+            base_delays=config.get('retry_base_delays'),
+            max_delay=float(config.get(
+                'retry_max_delay', DEFAULT_RETRY_MAX_DELAY)),
+            total_budget=int(config.get(
+                'retry_total_budget', DEFAULT_RETRY_TOTAL_BUDGET)),
+            budget_calls=int(config.get(
+                'retry_budget_calls', DEFAULT_RETRY_BUDGET_CALLS)),
+            breaker_failures=int(config.get(
+                'retry_breaker_failures', DEFAULT_RETRY_BREAKER_FAILURES)),
+            breaker_seconds=float(config.get(
+                'retry_breaker_seconds', DEFAULT_RETRY_BREAKER_SECONDS)))
+
+    def classify(self, error):
+        if isinstance(error, Fault):
+            if any(code in error.message for code in SESSION_FAULTS):
+                return 'session'
+            elif any(code in error.message for code in THROTTLE_FAULTS):
+                return 'throttle'
 
-class Stream:
+            return None
+
+        if isinstance(error, TransportError):
+            return 'server' if error.status_code >= 500 else None
+
+        if isinstance(error, (socket.timeout, ConnectionError,
+                              requests.Timeout, requests.ConnectionError)):
+            return 'network'
+
+        return None
+
+    def backoff(self, error_class, attempt):
+        # Exponential backoff with full jitter, so callers that failed
+        # together don't all come back at the same moment.
+        delay = min(self.max_delay,
+                    self.base_delays[error_class] * 2 ** (attempt - 1))
+
+        return random.uniform(0, delay)
+
+    def breaker_remaining(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+
+            return max(0, self.opened_at + self.breaker_seconds -
+                       time.time())
+
+    def wait_for_breaker(self):
+        remaining = self.breaker_remaining()
+
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def failed(self, error_class, attempt, error):
+        # Returns how long to wait before retrying, or raises once the
+        # error isn't retryable or a budget has run out.
+        if error_class is None:
+            raise error
+
+        with self._lock:
+            self.calls += 1
+
+            # A session expiry fails every call in flight at once, and
+            # logging in again fixes it right away. So session faults
+            # count neither towards the breaker nor the total budget.
+            if error_class != 'session':
+                self.consecutive_failures += 1
+
+            # Open the breaker, or open it again when a trial call after
+            # the pause fails too.
+            if self.consecutive_failures >= self.breaker_failures and \
+               (self.opened_at is None or
+                time.time() - self.opened_at >= self.breaker_seconds):
+                LOGGER.warning('{} calls to Bronto failed in a row, '
+                               'pausing all calls for {} seconds.'
+                               .format(self.consecutive_failures,
+                                       self.breaker_seconds))
+                self.opened_at = time.time()
+
+            if attempt > self.budgets[error_class]:
+                LOGGER.error('Retried more than {} times after {} errors, '
+                             'giving up!'.format(self.budgets[error_class],
+                                                 error_class))
+                raise error
+
+            if error_class != 'session':
+                while self.retried_calls and \
+                      self.retried_calls[0] <= self.calls - self.budget_calls:
+                    self.retried_calls.popleft()
+
+                if len(self.retried_calls) >= self.total_budget:
+                    LOGGER.error('Retried {} of the last {} calls, giving '
+                                 'up!'.format(len(self.retried_calls),
+                                              self.budget_calls))
+                    raise error
+
+                self.retried_calls.append(self.calls)
+
+        delay = self.backoff(error_class, attempt)
+        LOGGER.warning('Got a {} error ({}), retrying in {:.1f} seconds '
+                       '(attempt {} of {}).'
+                       .format(error_class, error, delay, attempt,
+                               self.budgets[error_class]))
+
+        return delay
+
+    def succeeded(self):
+        with self._lock:
+            self.calls += 1
+
+            if self.opened_at is not None:
+                LOGGER.info('Calls to Bronto are succeeding again.')
+
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+
+class Stream:  # pylint: disable=too-many-instance-attributes,too-many-public-methods
 
     TABLE = None
     KEY_PROPERTIES = []
     SCHEMA = {}
     REPLICATION_KEY = None
 
-    def __init__(self, config={}, state={}, catalog=[]):
+    def __init__(self, config={}, state={}, catalog=[], *, session=None,
+                 shared_state=None, retry_policy=None, rate_limiter=None,
+                 archive=None):
+        # pylint: disable=too-many-arguments
         self.client = None
+        self.factory = None
         self.config = config
         self.state = state
         self.catalog = catalog
+        self.session = session
+        self.shared_state = shared_state
+        self.window_planner = None
+        self.decoders = {}
+        self.decode_pool = None
+        self.custom_fields = {}
+        self.archive = archive
+        self.retry_policy = retry_policy or RetryPolicy.from_config(config)
+        self.rate_limiter = rate_limiter or RateLimiter.from_config(config)
 
     def get_start_date(self, table):
         LOGGER.info('Choosing start date for table {}'.format(table))
@@ -58,34 +352,339 @@ class Stream:
                                .format(replication_method))
         return start
 
+    def make_windows(self, start, interval, probe=None):
+        self.window_planner = WindowPlanner.from_config(self.config, interval)
+
+        if probe is not None and self.config.get('probe_empty_ranges'):
+            return self.probed_windows(start, interval, probe)
+
+        return self.window_planner.windows(start)
+
+    def probed_windows(self, start, interval, probe):
+        # Long backfills: ask about large spans first, and only walk the
+        # spans that actually have data. Recent history is always walked
+        # window by window.
+        span = timedelta(days=int(self.config.get(
+            'probe_span_days', DEFAULT_PROBE_SPAN_DAYS)))
+        horizon = datetime.now(pytz.utc) - span
+
+        cursor = start
+        while cursor < horizon:
+            span_end = min(cursor + span, horizon)
+
+            for window_start, window_end in self.find_spans_with_data(
+                    cursor, span_end, interval, probe):
+                yield from self.window_planner.windows(window_start,
+                                                       window_end)
+
+            cursor = span_end
+
+        yield from self.window_planner.windows(cursor)
+
+    def find_spans_with_data(self, start, end, interval, probe):
+        dense_rows = int(self.config.get(
+            'probe_dense_rows', DEFAULT_PROBE_DENSE_ROWS))
+
+        rows = probe(start, end)
+
+        if rows == 0:
+            LOGGER.info('No {} data from {} to {}, skipping.'
+                        .format(self.TABLE, start, end))
+            return
+
+        # Busy spans and spans already down to one window are walked as a
+        # whole; splitting them further would only add requests.
+        if rows >= dense_rows or end - start <= interval:
+            yield start, end
+            return
+
+        middle = start + (end - start) / 2
+        yield from self.find_spans_with_data(start, middle, interval, probe)
+        yield from self.find_spans_with_data(middle, end, interval, probe)
+
     def login(self):
-        LOGGER.info("Logging in")
+        if self.session is None:
+            self.session = SessionManager(self.config, self.rate_limiter)
+
+        # The login itself happens on the first call, where it is retried
+        # like any other request.
+        self.session.ensure_client()
+        self.client = self.session.client
+        self.factory = self.session.factory
+
+    def request_failed(self, request, attempts, error, session_id):
+        # Returns how long to wait before retrying, or raises when the
+        # error shouldn't be retried.
+        request.failed(error)
+
+        error_class = self.retry_policy.classify(error)
+        attempts[error_class] = attempts.get(error_class, 0) + 1
+        delay = self.retry_policy.failed(
+            error_class, attempts[error_class], error)
+
+        if error_class == 'throttle':
+            self.rate_limiter.throttled()
+        elif error_class == 'session':
+            LOGGER.warning("Got signed out - logging in again and retrying")
+            self.session.expire(session_id)
+
+        return delay
+
+    def request_succeeded(self):
+        self.retry_policy.succeeded()
+        self.rate_limiter.succeeded()
+        self.session.touch()
+
+    def request(self, operation, raw, window, page, kwargs):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        if self.archive is None:
+            return self.fetch(operation, raw, window, page, kwargs)
+
+        # The archive holds raw responses, so fetch them raw and parse
+        # them here when the caller wants zeep objects.
+        if self.archive.replay:
+            request, content = self.replay(operation, window, page)
+        else:
+            try:
+                request, content = self.fetch(operation, True, window, page,
+                                              kwargs)
+            except Fault as e:
+                self.archive.store_fault(operation, window, page, e)
+                raise
+
+            self.archive.store(operation, window, page, content)
+
+        if raw:
+            return request, content
+
+        started = time.perf_counter()
+        result = parse_raw_response(self.client, operation, content)
+        request.parse_seconds = time.perf_counter() - started
+
+        return request, result
+
+    def replay(self, operation, window, page):
+        request = RequestMetrics(self.TABLE, operation, window, page)
+
+        started = time.perf_counter()
+        content = self.archive.load(operation, window, page)
+        request.latency = time.perf_counter() - started
+        request.wire_bytes = request.bytes = len(content)
+
+        return request, content
+
+    def fetch(self, operation, raw, window, page, kwargs):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        attempts = {}
+        retries = 0
+
+        while True:
+            request = RequestMetrics(self.TABLE, operation, window, page,
+                                     retries=retries)
+
+            self.retry_policy.wait_for_breaker()
+            session_id = None
+            started = time.perf_counter()
+
+            try:
+                self.session.ensure_session()
+                session_id = self.session.session_id
+
+                request.wait_seconds = self.rate_limiter.acquire()
+                started = time.perf_counter()
+
+                try:
+                    if raw:
+                        result = send_raw(self.client, operation, kwargs)
+                    else:
+                        result = getattr(self.client.service,
+                                         operation)(**kwargs)
+                finally:
+                    self.rate_limiter.release()
+            except Exception as e:
+                request.latency = time.perf_counter() - started
+                time.sleep(self.request_failed(request, attempts, e,
+                                               session_id))
+                retries += 1
+                continue
+
+            break
+
+        elapsed = time.perf_counter() - started
+        self.request_succeeded()
+
+        request.latency, request.wire_bytes, request.bytes = \
+            self.client.transport.last_request()
+        if not raw:
+            request.parse_seconds = max(elapsed - request.latency, 0.0)
+
+        return request, result
+
+    async def request_async(self, transport, operation, window, page,
+                            kwargs):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # The same retries, limits, metrics and archive as request(), for
+        # calls made through an AsyncTransport. Always returns the raw
+        # response.
+        if self.is_replay():
+            return self.replay(operation, window, page)
+
         try:
-            client = zeep.Client(BRONTO_WSDL)
-            session_id = client.service.login(
-                self.config.get('token'))
+            request, content = await self.fetch_async(
+                transport, operation, window, page, kwargs)
+        except Fault as e:
+            if self.archive is not None:
+                self.archive.store_fault(operation, window, page, e)
+            raise
+
+        if self.archive is not None:
+            self.archive.store(operation, window, page, content)
+
+        return request, content
+
+    async def fetch_async(self, transport, operation, window, page,
+                          kwargs):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        attempts = {}
+        retries = 0
+
+        while True:
+            request = RequestMetrics(self.TABLE, operation, window, page,
+                                     retries=retries)
+
+            await asyncio.sleep(self.retry_policy.breaker_remaining())
+            session_id = None
+            started = time.perf_counter()
+
+            try:
+                # Logging in blocks on the session lock and the rate
+                # limiter, which only tasks on this loop can release, so
+                # it happens on a thread.
+                if self.session.is_stale():
+                    await asyncio.to_thread(self.session.ensure_session)
+                session_id = self.session.session_id
+
+                waited_from = time.monotonic()
+                while True:
+                    delay = self.rate_limiter.try_acquire(waited_from)
+                    if delay is None:
+                        break
+                    await asyncio.sleep(delay)
+                request.wait_seconds = time.monotonic() - waited_from
+                started = time.perf_counter()
+
+                try:
+                    content, request.wire_bytes, request.bytes = \
+                        await transport.send_raw(self.client, operation,
+                                                 kwargs)
+                finally:
+                    self.rate_limiter.release()
+            except Exception as e:
+                request.latency = time.perf_counter() - started
+                await asyncio.sleep(self.request_failed(
+                    request, attempts, e, session_id))
+                retries += 1
+                continue
+
+            break
+
+        request.latency = time.perf_counter() - started
+        self.request_succeeded()
+
+        return request, content
+
+    def call(self, operation, window=None, page=None, **kwargs):
+        request, result = self.request(operation, False, window, page, kwargs)
+
+        request.rows = len(result or [])
+        request.emit()
 
-            factory = client.type_factory(WSDL_NAMESPACE)
-            session_header = client.get_element("{%s}sessionHeader" % WSDL_NAMESPACE)
-            client.set_default_soapheaders([session_header(sessionId=session_id)])
-            self.client = client
-            self.factory = factory
+        return result
 
-        except Fault:
-            LOGGER.fatal("Login failed!")
-            sys.exit(1)
+    def uses_fast_decode(self):
+        return self.TABLE in (self.config.get('fast_decode_streams') or [])
+
+    def get_decoder(self, operation, flatten=(), custom_fields=None):
+        if operation not in self.decoders:
+            self.decoders[operation] = RecordDecoder(
+                build_return_spec(self.client, operation),
+                get_selected_fields(self.catalog, self.catalog.get('schema')),
+                flatten, custom_fields)
+
+        return self.decoders[operation]
+
+    def read_records(self, operation, field_selector, *, flatten=(),
+                     custom_fields=None, window=None, page=None, **kwargs):
+        # pylint: disable=too-many-arguments
+        # The request is made right away, so faults surface here, but the
+        # records are decoded lazily as the caller consumes them. With a
+        # decode pool the page comes back as encoded RECORD lines instead,
+        # to be written with write_page.
+        if self.decode_pool is not None:
+            decoder = self.get_decoder(operation, flatten, custom_fields)
+            request, content = self.request(operation, True, window, page,
+                                            kwargs)
+            records, request.decode_seconds = self.decode_pool.encode_page(
+                decoder, content, self.TABLE, singer.utils.now())
+        elif self.uses_fast_decode():
+            decoder = self.get_decoder(operation, flatten, custom_fields)
+            request, content = self.request(operation, True, window, page,
+                                            kwargs)
+            records = decoder.decode(content)
+        else:
+            request, results = self.request(operation, False, window, page,
+                                            kwargs)
+            records = decode_results(results, field_selector, flatten,
+                                     custom_fields)
+
+        return request.measure(records)
+
+    async def read_records_async(self, transport, operation, *, flatten=(),
+                                 custom_fields=None, window=None, page=None,
+                                 **kwargs):
+        # pylint: disable=too-many-arguments
+        # Async calls always use the fast decoder, since they only ever
+        # get the raw response.
+        decoder = self.get_decoder(operation, flatten, custom_fields)
+        request, content = await self.request_async(
+            transport, operation, window, page, kwargs)
+
+        if self.decode_pool is not None:
+            records, request.decode_seconds = \
+                await self.decode_pool.encode_page_async(
+                    decoder, content, self.TABLE, singer.utils.now())
+        else:
+            records = decoder.decode(content)
+
+        return request.measure(records)
+
+    def write_page(self, records, time_extracted=None):
+        # Pages from the decode pool were encoded with their own
+        # extraction time.
+        if self.decode_pool is not None:
+            return write_lines(records)
+
+        return write_records(self.TABLE, records,
+                             time_extracted=time_extracted)
+
+    def is_replay(self):
+        return self.archive is not None and self.archive.replay
+
+    def save_state(self):
+        # Replayed responses are as old as their recording, so bookmarks
+        # taken from this run's clock would move past data that was never
+        # recorded. A replay leaves the state alone.
+        if self.is_replay():
+            return
+
+        if self.shared_state is not None:
+            self.shared_state.save(self.state)
+        else:
+            save_state(self.state)
 
     @classmethod
     def matches_catalog(cls, catalog):
         return catalog.get('stream') == cls.TABLE
 
     def generate_catalog(self):
-        cls = self.__class__
-
-        return [{
-            'tap_stream_id': cls.TABLE,
-            'stream': cls.TABLE,
-            'key_properties': cls.KEY_PROPERTIES,
-            'schema': cls.SCHEMA,
-            'metadata': cls.METADATA
-        }]
+        return [catalog_entry(self.TABLE)]
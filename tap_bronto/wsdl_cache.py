@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import singer
+
+from zeep.cache import Base
+
+LOGGER = singer.get_logger()  # noqa
+
+CACHE_VERSION = '1'
+DEFAULT_CACHE_TTL = 7 * 24 * 60 * 60
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_path(kind):
+    # Where the tap caches one kind of thing (e.g. 'wsdl') by default.
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(base, 'tap-bronto', kind)
+
+
+def write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+# Each url maps to an index entry pointing at a content-addressed object,
+# so a document that changes upstream is stored as a new version instead
+# of overwriting the old one.
+class FileCache(Base):
+
+    def __init__(self, path=None, timeout=DEFAULT_CACHE_TTL):
+        self.path = os.path.join(path or cache_path('wsdl'),
+                                 'v{}'.format(CACHE_VERSION))
+        self.timeout = timeout
+
+    def _index_path(self, url):
+        return os.path.join(self.path, 'index',
+                            _sha256(url.encode('utf-8')) + '.json')
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest + '.xml')
+
+    def add(self, url, content):
+        digest = _sha256(content)
+        entry = {
+            'url': url,
+            'sha256': digest,
+            'created': time.time(),
+        }
+
+        try:
+            object_path = self._object_path(digest)
+            if not os.path.exists(object_path):
+                write_atomic(object_path, content)
+
+            write_atomic(self._index_path(url),
+                         json.dumps(entry).encode('utf-8'))
+        except OSError as e:
+            LOGGER.warning('Could not write WSDL cache entry for {}: {}'
+                           .format(url, e))
+
+    def get(self, url):
+        try:
+            with open(self._index_path(url), 'rb') as handle:
+                entry = json.loads(handle.read().decode('utf-8'))
+
+            if entry.get('url') != url:
+                return None
+
+            if self.timeout and \
+               time.time() - entry.get('created', 0) > self.timeout:
+                LOGGER.info('WSDL cache entry for {} expired.'.format(url))
+                return None
+
+            with open(self._object_path(entry['sha256']), 'rb') as handle:
+                content = handle.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if _sha256(content) != entry['sha256']:
+            LOGGER.warning('WSDL cache entry for {} is corrupt, ignoring.'
+                           .format(url))
+            return None
+
+        return content
+
+
+def get_wsdl_cache(config):
+    if config.get('wsdl_cache') is False:
+        return None
+
+    return FileCache(
+        path=config.get('wsdl_cache_dir'),
+        timeout=int(config.get('wsdl_cache_ttl', DEFAULT_CACHE_TTL)))
@@ -0,0 +1,73 @@
+import copy
+import os
+import socket
+import sys
+
+import pytest
+
+from singer import metadata
+
+# The mock Bronto API lives with the benchmarks.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'benchmarks'))
+
+import mock_bronto  # noqa: E402
+
+from tap_bronto import session  # noqa: E402
+
+
+def select_all(entry):
+    # Selects every field of a catalog entry, as a user selecting all would.
+    # The metadata is copied, as catalog_entry shares it between calls.
+    mdata = metadata.to_map(copy.deepcopy(entry['metadata']))
+
+    for breadcrumb in mdata:
+        mdata = metadata.write(mdata, breadcrumb, 'selected', True)
+
+    return dict(entry, metadata=metadata.to_list(mdata))
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch, tmp_path):
+    # Every test gets its own cache directory and parsed clients.
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setattr(session, '_CLIENTS', {})
+
+
+def _refuse(self, address):
+    raise OSError('Network access in an offline test: {}'.format(address))
+
+
+@pytest.fixture
+def go_offline(monkeypatch):
+    # Call it to make every socket connection fail from then on.
+    def block():
+        monkeypatch.setattr(socket.socket, 'connect', _refuse)
+
+    return block
+
+
+@pytest.fixture
+def start_mock():
+    # Starts mock Bronto APIs on free ports; returns (mock, wsdl url).
+    servers = []
+
+    def start(page_size=100, faults=None, **account):
+        mock = mock_bronto.MockBronto(mock_bronto.Account(**account),
+                                      page_size=page_size, **(faults or {}))
+        server, wsdl = mock_bronto.start_in_thread(mock)
+        servers.append(server)
+
+        return mock, wsdl
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def mock_api(start_mock):
+    return start_mock(contacts=300, lists=5, unsubscribes=50, inbound=400,
+                      outbound=400, fields=3, days=5, seed=1)
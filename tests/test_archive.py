@@ -0,0 +1,113 @@
+import json
+import os
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from zeep.exceptions import Fault
+
+from conftest import select_all
+from tap_bronto.archive import ResponseArchive, empty_response
+from tap_bronto.endpoints.inbound_activity import InboundActivityStream
+from tap_bronto.schemas import catalog_entry
+
+
+WINDOW = (datetime(2026, 10, 1, tzinfo=timezone.utc),
+          datetime(2026, 10, 1, 6, tzinfo=timezone.utc))
+
+
+def test_stored_responses_load_back_by_operation_window_and_page(tmp_path):
+    archive = ResponseArchive(str(tmp_path))
+    archive.store('readContacts', WINDOW, 2, b'<page two/>')
+    archive.store('readContacts', WINDOW, None, b'<page one/>')
+
+    assert archive.load('readContacts', WINDOW, 2) == b'<page two/>'
+    assert archive.load('readContacts', WINDOW, 1) == b'<page one/>'
+    assert os.path.exists(os.path.join(
+        str(tmp_path), 'readContacts',
+        '20261001T000000.000000Z_20261001T060000.000000Z', '2.xml.gz'))
+
+    # A page that was never recorded ends the window like an empty one.
+    assert archive.load('readContacts', WINDOW, 3) == \
+        empty_response('readContacts')
+    assert archive.load('readLists', None, 1) == empty_response('readLists')
+
+
+def test_stored_faults_are_raised_again_until_a_response_replaces_them(
+        tmp_path):
+    archive = ResponseArchive(str(tmp_path))
+    archive.store('readRecentInboundActivities', WINDOW, 4, b'<page/>')
+    archive.store_fault('readRecentInboundActivities', WINDOW, 4,
+                        Fault('116: End of result set', 'soap:Server'))
+
+    with pytest.raises(Fault) as raised:
+        archive.load('readRecentInboundActivities', WINDOW, 4)
+
+    assert raised.value.message == '116: End of result set'
+    assert raised.value.code == 'soap:Server'
+
+    archive.store('readRecentInboundActivities', WINDOW, 4, b'<page/>')
+    assert archive.load('readRecentInboundActivities', WINDOW, 4) == \
+        b'<page/>'
+
+
+def test_replaying_needs_an_archive_dir():
+    assert ResponseArchive.from_config({}) is None
+
+    with pytest.raises(RuntimeError):
+        ResponseArchive.from_config({}, replay=True)
+
+
+def read_index(path):
+    index = {}
+
+    for directory, _, filenames in os.walk(path):
+        for filename in filenames:
+            with open(os.path.join(directory, filename), 'rb') as handle:
+                index[filename] = handle.read()
+
+    return index
+
+
+def sync_activities(config, archive, capsys):
+    stream = InboundActivityStream(config, catalog=select_all(
+        catalog_entry(InboundActivityStream.TABLE)), archive=archive)
+    stream.login()
+    stream.sync()
+
+    messages = [json.loads(line)
+                for line in capsys.readouterr().out.splitlines()]
+
+    return ([message['record'] for message in messages
+             if message['type'] == 'RECORD'],
+            [message for message in messages if message['type'] == 'STATE'])
+
+
+def test_replay_leaves_the_dedup_index_alone(start_mock, tmp_path, capsys):
+    _, wsdl = start_mock(contacts=50, inbound=500, days=5)
+    start = datetime.now(timezone.utc) - timedelta(days=5)
+    dedup_path = str(tmp_path / 'dedup')
+    config = {
+        'token': 'test',
+        'wsdl': wsdl,
+        'start_date': start.isoformat(),
+        'activity_dedup_dir': dedup_path,
+    }
+    archive_path = str(tmp_path / 'archive')
+
+    recorded, states = sync_activities(
+        config, ResponseArchive(archive_path), capsys)
+    index = read_index(dedup_path)
+
+    assert recorded and states
+    assert index
+
+    # Replaying without a state file used to clear the index, and its
+    # filter could drop what the recording emitted.
+    replayed, states = sync_activities(
+        config, ResponseArchive(archive_path, replay=True), capsys)
+
+    assert replayed == recorded
+    assert states == []
+    assert read_index(dedup_path) == index
@@ -0,0 +1,37 @@
+import threading
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import select_all
+from tap_bronto.endpoints.contact import ContactStream
+from tap_bronto.schemas import catalog_entry
+
+
+def test_async_windows_probe_off_the_event_loop(start_mock, capsys):
+    pytest.importorskip('aiohttp')
+
+    # Sparse enough that some windows come up empty and are probed
+    # while others are still being fetched.
+    _, wsdl = start_mock(contacts=800, days=60, seed=1)
+    start = datetime.now(timezone.utc) - timedelta(days=60)
+    stream = ContactStream({
+        'token': 'test',
+        'wsdl': wsdl,
+        'start_date': start.isoformat(),
+        'contact_fetch_mode': 'async',
+        'contact_window_workers': 4,
+        'probe_empty_ranges': True,
+        'max_in_flight_requests': 2,
+    }, catalog=select_all(catalog_entry(ContactStream.TABLE)))
+    stream.login()
+
+    # Probing on the loop used to wait forever on limiter slots held by
+    # window tasks on that same loop.
+    thread = threading.Thread(target=stream.sync, daemon=True)
+    thread.start()
+    thread.join(60)
+
+    assert not thread.is_alive()
+    assert '"type": "RECORD"' in capsys.readouterr().out
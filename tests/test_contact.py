@@ -0,0 +1,47 @@
+from tap_bronto.endpoints.contact import CONTACT_INCLUDE_FLAGS, \
+    ContactRequestPlan
+
+
+def test_plan_only_includes_sections_of_selected_fields():
+    plan = ContactRequestPlan(['id', 'email', 'listIds', 'geoIPCity',
+                               'geoIPZip', 'lastOpenDate'])
+
+    assert plan.options == {
+        'includeLists': True,
+        'includeSMSKeywords': False,
+        'includeGeoIPData': True,
+        'includeTechnologyData': False,
+        'includeRFMData': False,
+        'includeEngagementData': True,
+        'fields': [],
+    }
+    assert plan.reasons['includeGeoIPData'] == ['geoIPCity', 'geoIPZip']
+
+
+def test_plan_asks_for_selected_custom_fields_by_id():
+    plan = ContactRequestPlan(['id'], {
+        '0bc403e9': ('favorite_color', 'text'),
+        '0bc403ea': ('birthday', 'date'),
+    })
+
+    assert sorted(plan.options['fields']) == ['0bc403e9', '0bc403ea']
+    assert 'readContacts fields: 2 custom field(s), for ' \
+           'favorite_color, birthday.' in list(plan.explain())
+
+
+def test_plan_without_selected_fields_leaves_every_section_out():
+    plan = ContactRequestPlan([])
+
+    assert not any(plan.options[flag] for flag, _ in CONTACT_INCLUDE_FLAGS)
+    assert plan.options['fields'] == []
+    assert list(plan.explain())[-1] == \
+        'readContacts fields: none, no custom field is selected.'
+
+
+def test_plan_explains_every_flag():
+    lines = list(ContactRequestPlan(['listIds']).explain())
+
+    assert lines[0] == 'readContacts includeLists: on, for listIds.'
+    assert lines[1] == 'readContacts includeSMSKeywords: off, no field ' \
+                       'that needs it is selected.'
+    assert len(lines) == len(CONTACT_INCLUDE_FLAGS) + 1
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import select_all
+from tap_bronto.custom_fields import get_selected_custom_fields
+from tap_bronto.decode import RecordDecoder, build_return_spec, \
+    decode_results, parse_raw_response
+from tap_bronto.endpoints.contact import ContactRequestPlan, ContactStream
+from tap_bronto.endpoints.inbound_activity import InboundActivityStream
+from tap_bronto.endpoints.list import ListStream
+from tap_bronto.endpoints.outbound_activity import OutboundActivityStream
+from tap_bronto.endpoints.unsubscribe import UnsubscribeStream
+from tap_bronto.output import encode_json
+from tap_bronto.schemas import get_field_selector, get_selected_fields
+
+
+def make_stream(stream_class, wsdl):
+    # Discovered the way the tap does it, custom contact fields included.
+    stream = stream_class({'token': 'test', 'wsdl': wsdl,
+                           'custom_fields': True})
+    stream.catalog = select_all(stream.generate_catalog()[0])
+    stream.login()
+
+    return stream
+
+
+def read_contacts(stream):
+    fields = get_selected_custom_fields(stream.catalog)
+    plan = ContactRequestPlan(stream.SCHEMA['properties'], fields)
+    end = datetime.now(timezone.utc) + timedelta(days=1)
+    kwargs = dict(plan.options,
+                  filter=stream.make_filter(end - timedelta(days=30), end))
+
+    for page in range(1, 5):
+        yield 'readContacts', ['readOnlyContactData'], fields, \
+            dict(kwargs, pageNumber=page)
+
+
+def read_lists(stream):
+    for page in range(1, 3):
+        yield 'readLists', [], None, dict(
+            filter=stream.make_filter(), pageNumber=page, pageSize=5000)
+
+
+def read_unsubscribes(stream):
+    end = datetime.now(timezone.utc) + timedelta(days=1)
+    _filter = stream.make_filter(end - timedelta(days=30), end)
+
+    for page in range(1, 3):
+        yield 'readUnsubscribes', [], None, dict(filter=_filter,
+                                                 pageNumber=page)
+
+
+def read_activities(operation):
+    def read(stream):
+        end = datetime.now(timezone.utc) + timedelta(hours=1)
+        _filter = stream.make_filter(end - timedelta(days=29), end)
+
+        for _ in range(3):
+            yield operation, [], None, dict(filter=_filter)
+            _filter.readDirection = 'NEXT'
+
+    return read
+
+
+@pytest.mark.parametrize('stream_class, pages', [
+    (ContactStream, read_contacts),
+    (ListStream, read_lists),
+    (UnsubscribeStream, read_unsubscribes),
+    (InboundActivityStream,
+     read_activities('readRecentInboundActivities')),
+    (OutboundActivityStream,
+     read_activities('readRecentOutboundActivities')),
+])
+def test_fast_decode_matches_zeep(mock_api, stream_class, pages):
+    _, wsdl = mock_api
+    stream = make_stream(stream_class, wsdl)
+    schema = stream.catalog['schema']
+    compared = 0
+    properties = set()
+
+    for operation, flatten, fields, kwargs in pages(stream):
+        # Both decoders get the very same response bytes.
+        _, content = stream.request(operation, True, None, None, kwargs)
+
+        fast = RecordDecoder(build_return_spec(stream.client, operation),
+                             get_selected_fields(stream.catalog, schema),
+                             flatten, fields).decode(content)
+        slow = decode_results(
+            parse_raw_response(stream.client, operation, content),
+            get_field_selector(stream.catalog, schema), flatten, fields)
+
+        fast = list(fast)
+        slow = list(slow)
+
+        assert [encode_json(record) for record in fast] == \
+            [encode_json(record) for record in slow]
+
+        compared += len(fast)
+        for record in fast:
+            properties.update(name for name, value in record.items()
+                              if value not in (None, []))
+
+    assert compared > 0
+    # Every section the request asked for came back and was compared.
+    if fields:
+        assert {name for name, _ in fields.values()} <= properties
+        assert 'listIds' in properties
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from tap_bronto.dedup import DedupIndex
+
+
+def activities(start, hours):
+    return [{'activityDate': (start + timedelta(hours=hour)).isoformat(),
+             'contactId': str(hour)} for hour in range(hours)]
+
+
+def test_rewind_emits_records_past_the_bookmark_again(tmp_path):
+    start = datetime(2026, 10, 1, tzinfo=pytz.utc)
+    records = activities(start, 6)
+
+    index = DedupIndex(str(tmp_path), 'activityDate')
+    assert len(list(index.filter(records))) == 6
+    index.save()
+
+    # The target only committed the state from before hour 3, so the
+    # next run resumes from there.
+    index = DedupIndex(str(tmp_path), 'activityDate')
+    index.rewind(start + timedelta(hours=3, minutes=30))
+
+    assert list(index.filter(records)) == records[3:]
+    assert index.suppressed == 3
@@ -0,0 +1,55 @@
+import hashlib
+
+import pytest
+
+from funcy import filter, identity, project
+
+from tap_bronto.ids import IdBuilder, get_hasher
+
+RECORDS = [
+    {'createdDate': '2026-10-01T12:00:00+00:00', 'activityType': 'open',
+     'contactId': 'c1', 'listId': 'l1', 'segmentId': 's1',
+     'keywordId': 'k1', 'messageId': 'm1', 'deliveryId': 'd1'},
+    {'messageId': 'm2', 'activityType': 'click', 'contactId': 'c2',
+     'createdDate': '2026-10-01T12:00:01+00:00', 'listId': None,
+     'segmentId': '', 'emailAddress': 'someone@example.com'},
+    {'createdDate': '2026-10-01T12:00:02+00:00', 'activityType': 'send'},
+    {'activityType': 'sms_send', 'keywordId': 'k3', 'contactId': 'c3'},
+]
+
+
+def baseline_id(result):
+    # The id the activity streams built before IdBuilder.
+    ids = ['createdDate', 'activityType', 'contactId',
+           'listId', 'segmentId', 'keywordId', 'messageId']
+
+    return hashlib.md5(
+        '|'.join(filter(identity,
+                        project(result, ids).values()))
+        .encode('utf-8')).hexdigest()
+
+
+@pytest.mark.parametrize('record', RECORDS)
+def test_default_ids_match_the_ones_the_tap_has_always_produced(record):
+    assert IdBuilder()(record) == baseline_id(record)
+
+
+def test_with_ids_sets_the_id_of_each_record():
+    records = [dict(record) for record in RECORDS]
+
+    assert [record['id'] for record in IdBuilder().with_ids(records)] == \
+        [baseline_id(record) for record in RECORDS]
+
+
+@pytest.mark.parametrize('name', ['blake2b', 'xxhash'])
+def test_other_hashers_still_tell_activities_apart(name):
+    build_id = IdBuilder(hasher=get_hasher(name))
+    ids = [build_id(record) for record in RECORDS]
+
+    assert len(set(ids)) == len(RECORDS)
+    assert build_id(dict(RECORDS[0])) == ids[0]
+
+
+def test_unknown_hashers_are_refused():
+    with pytest.raises(ValueError):
+        get_hasher('sha1')
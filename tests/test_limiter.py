@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from tap_bronto import limiter
+from tap_bronto.limiter import RECOVER_AFTER_CALLS, RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # A monotonic clock that only moves when the test moves it.
+    now = [1000.0]
+
+    def advance(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr(limiter.time, 'monotonic', lambda: now[0])
+
+    return advance
+
+
+def test_requests_per_second_allows_a_burst_then_spaces_calls(clock):
+    rate_limiter = RateLimiter(requests_per_second=2)
+
+    assert rate_limiter.try_acquire(0) is None
+    assert rate_limiter.try_acquire(0) is None
+    assert rate_limiter.try_acquire(0) == pytest.approx(0.5)
+
+    clock(0.25)
+    assert rate_limiter.try_acquire(0) == pytest.approx(0.25)
+
+    clock(0.25)
+    assert rate_limiter.try_acquire(0) is None
+    assert rate_limiter.calls == 3
+
+
+def test_a_full_set_of_slots_waits_for_a_release():
+    rate_limiter = RateLimiter(max_in_flight=2)
+
+    assert rate_limiter.try_acquire(0) is None
+    assert rate_limiter.try_acquire(0) is None
+    assert rate_limiter.try_acquire(0) == limiter.POLL_SECONDS
+
+    rate_limiter.release()
+    assert rate_limiter.try_acquire(0) is None
+
+
+def test_max_in_flight_caps_concurrent_calls():
+    rate_limiter = RateLimiter(max_in_flight=3)
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+
+    def call():
+        rate_limiter.acquire()
+        try:
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+        finally:
+            rate_limiter.release()
+
+    threads = [threading.Thread(target=call) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 3
+    assert rate_limiter.peak_in_flight == 3
+    assert rate_limiter.calls == 12
+
+
+def test_throttling_halves_the_limits_until_calls_succeed_again():
+    rate_limiter = RateLimiter(requests_per_second=8, max_in_flight=4)
+
+    rate_limiter.throttled()
+    assert rate_limiter.rate == 4
+    assert rate_limiter.in_flight_limit == 2
+
+    # Each run of successful calls raises the limits one step.
+    for _ in range(RECOVER_AFTER_CALLS - 1):
+        rate_limiter.succeeded()
+    assert rate_limiter.rate == 4
+
+    rate_limiter.succeeded()
+    assert rate_limiter.rate == pytest.approx(4.8)
+    assert rate_limiter.in_flight_limit == 3
+
+    for _ in range(10 * RECOVER_AFTER_CALLS):
+        rate_limiter.succeeded()
+    assert rate_limiter.rate == 8
+    assert rate_limiter.in_flight_limit == 4
+
+
+def test_throttling_without_a_cap_limits_concurrency_for_a_while():
+    rate_limiter = RateLimiter()
+
+    for _ in range(4):
+        assert rate_limiter.try_acquire(0) is None
+    for _ in range(4):
+        rate_limiter.release()
+
+    rate_limiter.throttled()
+    assert rate_limiter.in_flight_limit == 2
+
+    for _ in range(2 * RECOVER_AFTER_CALLS):
+        rate_limiter.succeeded()
+    assert rate_limiter.in_flight_limit is None
@@ -0,0 +1,62 @@
+import gc
+import tracemalloc
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import select_all
+from tap_bronto.endpoints.inbound_activity import InboundActivityStream
+from tap_bronto.schemas import catalog_entry, get_field_selector
+
+PAGE_SIZES = [250, 1000, 4000]
+
+# Well under a single page of 1000 activities (about 500 KB of XML, and
+# about 1 MB as decoded records), so holding on to a page's records
+# fails the test.
+CEILING_BYTES = 256 * 1024
+
+
+def peak_while_consuming(stream, page_size):
+    # The page is fetched when read_records is called; only what the
+    # records cost while they are consumed one at a time is traced.
+    end = datetime.now(timezone.utc) + timedelta(hours=1)
+    records = stream.read_records(
+        'readRecentInboundActivities',
+        get_field_selector(stream.catalog, stream.catalog['schema']),
+        filter=stream.make_filter(end - timedelta(days=29), end))
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in records)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # The mock spreads activities at random, so a few fall outside the
+    # window.
+    assert count > page_size * 0.9
+
+    return peak
+
+
+@pytest.mark.parametrize('fast_decode', [False, True])
+def test_memory_stays_flat_across_page_sizes(start_mock, fast_decode):
+    peaks = []
+
+    for page_size in PAGE_SIZES:
+        _, wsdl = start_mock(page_size=page_size, contacts=1, lists=1,
+                             unsubscribes=1, inbound=page_size, outbound=1,
+                             days=1)
+        config = {'token': 'test', 'wsdl': wsdl}
+        if fast_decode:
+            config['fast_decode_streams'] = [InboundActivityStream.TABLE]
+
+        stream = InboundActivityStream(config, catalog=select_all(
+            catalog_entry(InboundActivityStream.TABLE)))
+        stream.login()
+
+        peaks.append(peak_while_consuming(stream, page_size))
+
+    assert max(peaks) < CEILING_BYTES, peaks
@@ -0,0 +1,85 @@
+import pytest
+import requests
+
+from zeep.exceptions import Fault
+
+from conftest import select_all
+from tap_bronto.endpoints.list import ListStream
+from tap_bronto.schemas import catalog_entry
+from tap_bronto.stream import RetryPolicy
+
+
+def make_policy(**kwargs):
+    return RetryPolicy(base_delays={'session': 0, 'network': 0},
+                       breaker_failures=10 ** 6, **kwargs)
+
+
+def test_session_faults_are_not_charged_to_the_total_budget():
+    policy = make_policy(total_budget=2, budget_calls=100)
+    fault = Fault('103: Authentication failed for session')
+
+    for _ in range(50):
+        assert policy.failed(policy.classify(fault), 1, fault) == 0
+        policy.succeeded()
+
+
+def test_total_budget_counts_retries_within_recent_calls():
+    policy = make_policy(total_budget=2, budget_calls=10)
+    error = ConnectionError('reset')
+
+    policy.failed('network', 1, error)
+    policy.failed('network', 1, error)
+
+    with pytest.raises(ConnectionError):
+        policy.failed('network', 1, error)
+
+    # Once the earlier retries are more than budget_calls calls back,
+    # they no longer count against the budget.
+    for _ in range(10):
+        policy.succeeded()
+
+    policy.failed('network', 1, error)
+
+
+def test_session_faults_do_not_open_the_breaker():
+    policy = RetryPolicy(base_delays={'session': 0}, breaker_failures=3)
+    fault = Fault('103: Authentication failed for session')
+
+    # Every call in flight fails at once when the session expires.
+    for _ in range(12):
+        policy.failed('session', 1, fault)
+
+    assert policy.breaker_remaining() == 0
+
+    error = ConnectionError('reset')
+    for _ in range(3):
+        policy.failed('network', 1, error)
+
+    assert policy.breaker_remaining() > 0
+
+
+def test_stalled_calls_time_out_and_are_retried(start_mock, monkeypatch,
+                                                capsys):
+    _, wsdl = start_mock(page_size=2, lists=5, faults={
+        'timeout_every': 3, 'stall_seconds': 1.0})
+    errors = []
+    failed = RetryPolicy.failed
+
+    def record(policy, error_class, attempt, error):
+        errors.append((error_class, error))
+        return failed(policy, error_class, attempt, error)
+
+    monkeypatch.setattr(RetryPolicy, 'failed', record)
+
+    stream = ListStream({'token': 'test', 'wsdl': wsdl,
+                         'http_read_timeout': 0.2,
+                         'retry_base_delays': {'network': 0}},
+                        catalog=select_all(catalog_entry(ListStream.TABLE)))
+    stream.login()
+    stream.sync()
+
+    assert errors
+    assert all(error_class == 'network' and
+               isinstance(error, requests.Timeout)
+               for error_class, error in errors)
+    assert capsys.readouterr().out.count('"type": "RECORD"') == 5
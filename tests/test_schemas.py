@@ -0,0 +1,50 @@
+import copy
+
+from datetime import datetime, timezone
+
+from singer import metadata
+
+from tap_bronto.schemas import catalog_entry, get_field_selector
+
+
+def select(entry, fields):
+    mdata = metadata.to_map(copy.deepcopy(entry['metadata']))
+
+    for field in fields:
+        mdata = metadata.write(mdata, ('properties', field), 'selected', True)
+
+    return dict(entry, metadata=metadata.to_list(mdata))
+
+
+def test_selector_keeps_selected_and_automatic_fields_only():
+    entry = select(catalog_entry('contact'),
+                   ['email', 'numSends', 'created'])
+    created = datetime(2026, 10, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+    selector = get_field_selector(entry, entry['schema'])
+
+    record = selector({
+        'id': 'c1',
+        'modified': created,
+        'email': 'someone@example.com',
+        'numSends': 3,
+        'created': created,
+        'status': 'active',
+        'notInTheSchema': 'value',
+    })
+
+    # id and modified are automatic, status was never selected, and
+    # datetimes in string fields come out as ISO strings.
+    assert record == {
+        'id': 'c1',
+        'modified': '2026-10-01T12:30:15+00:00',
+        'email': 'someone@example.com',
+        'numSends': 3,
+        'created': '2026-10-01T12:30:15+00:00',
+    }
+
+
+def test_selector_skips_selected_fields_missing_from_the_record():
+    entry = select(catalog_entry('list'), ['name'])
+    selector = get_field_selector(entry, entry['schema'])
+
+    assert selector({'id': 'l1'}) == {'id': 'l1'}
@@ -0,0 +1,105 @@
+import json
+import threading
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import select_all
+from tap_bronto.endpoints.contact import ContactStream
+from tap_bronto.schemas import catalog_entry
+from tap_bronto.state import SharedState, incorporate, merge_state
+
+
+def bookmark(value):
+    return {'field': 'modified', 'last_record': value}
+
+
+def test_merge_state_keeps_the_later_bookmark_of_each_table():
+    state = {'bookmarks': {'contact': bookmark('2026-10-02T00:00:00Z'),
+                           'list': bookmark('2026-10-01T00:00:00Z')}}
+    other = {'bookmarks': {'contact': bookmark('2026-10-01T00:00:00Z'),
+                           'list': bookmark('2026-10-03T00:00:00Z'),
+                           'unsubscribe': bookmark('2026-10-04T00:00:00Z')}}
+
+    assert merge_state(state, other) == {'bookmarks': {
+        'contact': bookmark('2026-10-02T00:00:00Z'),
+        'list': bookmark('2026-10-03T00:00:00Z'),
+        'unsubscribe': bookmark('2026-10-04T00:00:00Z'),
+    }}
+    assert state['bookmarks']['list'] == bookmark('2026-10-01T00:00:00Z')
+
+
+def test_shared_state_keeps_every_stream_s_latest_bookmark(capsys):
+    shared = SharedState({})
+    start = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    tables = ['contact', 'inbound_activity', 'outbound_activity',
+              'unsubscribe']
+
+    # Each stream saves its own copy of the state it started from, which
+    # knows nothing of the other streams' progress since.
+    def sync(table):
+        state = shared.snapshot()
+        for hour in range(50):
+            state = incorporate(state, table, 'modified',
+                                (start + timedelta(hours=hour)).isoformat())
+            shared.save(state)
+
+    threads = [threading.Thread(target=sync, args=(table,))
+               for table in tables]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert shared.snapshot() == {'bookmarks': {
+        table: bookmark('2026-10-03T01:00:00Z') for table in tables}}
+
+    # Every state written has to be complete, as the target may stop
+    # at any of them.
+    last = json.loads(capsys.readouterr().out.splitlines()[-1])
+    assert last['value'] == shared.snapshot()
+
+
+def sync_contacts(config, state, capsys):
+    stream = ContactStream(config, state=state, catalog=select_all(
+        catalog_entry(ContactStream.TABLE)))
+    stream.login()
+    stream.sync()
+
+    return [json.loads(line)
+            for line in capsys.readouterr().out.splitlines()]
+
+
+def record_ids(messages):
+    return [message['record']['id'] for message in messages
+            if message['type'] == 'RECORD']
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_resuming_from_a_checkpoint_finishes_the_window(start_mock, capsys,
+                                                        workers):
+    _, wsdl = start_mock(page_size=5, contacts=200, days=3)
+    start = datetime.now(timezone.utc) - timedelta(days=3)
+    config = {
+        'token': 'test',
+        'wsdl': wsdl,
+        'start_date': start.replace(microsecond=0).isoformat(),
+        'contact_window_workers': workers,
+    }
+
+    messages = sync_contacts(config, {}, capsys)
+    states = [index for index, message in enumerate(messages)
+              if message['type'] == 'STATE']
+
+    # Stop the run just after the third page of its fourth window.
+    stopped = [index for index in states
+               if messages[index]['value']['bookmarks']['contact']
+               .get('checkpoint', {}).get('page') == 3][3]
+    previous = max(index for index in states if index < stopped)
+
+    resumed = sync_contacts(config, messages[stopped]['value'], capsys)
+
+    # The last page written is read again; nothing before it is, and no
+    # window after it is left out.
+    assert record_ids(resumed) == record_ids(messages[previous:])
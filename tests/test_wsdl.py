@@ -0,0 +1,59 @@
+import time
+
+import mock_bronto
+
+from tap_bronto import session
+from tap_bronto.decode import build_return_spec
+from tap_bronto.session import get_client
+from tap_bronto.wsdl_cache import FileCache
+
+OPERATIONS = ['login', 'readContacts', 'readLists', 'readUnsubscribes',
+              'readRecentInboundActivities', 'readRecentOutboundActivities',
+              'readFields']
+
+
+def test_local_wsdl_loads_offline(go_offline):
+    go_offline()
+    client = get_client({'wsdl': mock_bronto.WSDL_PATH})
+
+    assert client.wsdl.location == mock_bronto.WSDL_PATH
+
+    for operation in OPERATIONS:
+        assert client.service._binding.get(operation) is not None
+
+    assert 'email' in build_return_spec(client, 'readContacts')
+
+
+def test_remote_wsdl_is_served_from_cache_offline(mock_api, go_offline,
+                                                  monkeypatch, tmp_path):
+    _, wsdl = mock_api
+    config = {'wsdl': wsdl, 'wsdl_cache_dir': str(tmp_path / 'wsdl')}
+
+    get_client(config)
+
+    # A new process would start with no parsed clients and no network.
+    monkeypatch.setattr(session, '_CLIENTS', {})
+    go_offline()
+
+    client = get_client(config)
+
+    assert client.service._binding.get('readContacts') is not None
+
+
+def test_file_cache_round_trip(tmp_path):
+    cache = FileCache(path=str(tmp_path))
+    cache.add('http://example.com/v4?wsdl', b'<definitions/>')
+
+    assert cache.get('http://example.com/v4?wsdl') == b'<definitions/>'
+    assert cache.get('http://example.com/other') is None
+
+
+def test_file_cache_expires(tmp_path, monkeypatch):
+    cache = FileCache(path=str(tmp_path), timeout=60)
+    cache.add('http://example.com/v4?wsdl', b'<definitions/>')
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+
+    assert cache.get('http://example.com/v4?wsdl') is None
+